@@ -0,0 +1,120 @@
+"""blood glucose readings
+
+Revision ID: 3f9a6c1d2b7e
+Revises: e13f3c1e7459
+Create Date: 2026-10-18 11:02:37.418230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9a6c1d2b7e'
+down_revision: Union[str, None] = 'e13f3c1e7459'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('blood_glucose_readings',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('patient_id', sa.UUID(), nullable=False),
+    sa.Column('measured_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('value', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['patient_id'], ['patients.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_blood_glucose_readings_patient_id_measured_at', 'blood_glucose_readings', ['patient_id', 'measured_at'], unique=False)
+
+    # entries of the old json array that can't be converted are kept here instead of failing the migration
+    op.create_table('blood_glucose_readings_quarantine',
+    sa.Column('health_record_id', sa.UUID(), nullable=False),
+    sa.Column('patient_id', sa.UUID(), nullable=False),
+    sa.Column('reading', sa.JSON(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('quarantined_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False)
+    )
+
+    # backfill one row per entry of the old json array. the legacy values are free-form, each entry is
+    # converted in its own subtransaction n the ones failing to cast are quarantined w the error
+    op.execute("""
+        DO $$
+        DECLARE
+            hr record;
+            reading json;
+        BEGIN
+            FOR hr IN
+                SELECT id, patient_id, blood_glucose_records AS records
+                FROM health_records
+                WHERE blood_glucose_records IS NOT NULL
+                  AND json_typeof(blood_glucose_records) <> 'null'
+            LOOP
+                IF json_typeof(hr.records) <> 'array' THEN
+                    INSERT INTO blood_glucose_readings_quarantine (health_record_id, patient_id, reading, error)
+                    VALUES (hr.id, hr.patient_id, hr.records, 'not a json array');
+                    CONTINUE;
+                END IF;
+
+                FOR reading IN SELECT value FROM json_array_elements(hr.records) LOOP
+                    BEGIN
+                        INSERT INTO blood_glucose_readings (id, patient_id, measured_at, value)
+                        VALUES (
+                            gen_random_uuid(),
+                            hr.patient_id,
+                            (reading->>'measurement_time')::timestamptz,
+                            (reading->>'value')::integer
+                        );
+                    EXCEPTION WHEN others THEN
+                        INSERT INTO blood_glucose_readings_quarantine (health_record_id, patient_id, reading, error)
+                        VALUES (hr.id, hr.patient_id, reading, SQLERRM);
+                    END;
+                END LOOP;
+            END LOOP;
+        END
+        $$;
+    """)
+
+    # health_records.blood_glucose_records is no longer mapped but kept untouched, so the backfill can be
+    # checked (n re-run) against it. a later migration drops it together w the quarantine table
+
+
+def downgrade() -> None:
+    # fold the readings back into the json array of the earliest health record of each patient, the
+    # readings don't tell which record they came from n readings appended since the upgrade only exist
+    # in the new table. the quarantined entries go back to their own record, the other records of those
+    # patients are emptied so no reading ends up in two arrays
+    op.execute("""
+        WITH first_records AS (
+            SELECT DISTINCT ON (patient_id) id, patient_id
+            FROM health_records
+            ORDER BY patient_id, created_at NULLS LAST, id
+        ),
+        merged AS (
+            SELECT health_record_id, json_agg(reading ORDER BY measured_at NULLS LAST) AS records
+            FROM (
+                SELECT f.id AS health_record_id, json_build_object('value', g.value, 'measurement_time', g.measured_at) AS reading, g.measured_at
+                FROM blood_glucose_readings g
+                JOIN first_records f ON f.patient_id = g.patient_id
+                UNION ALL
+                SELECT health_record_id, reading, NULL
+                FROM blood_glucose_readings_quarantine
+                WHERE json_typeof(reading) = 'object'
+            ) AS readings
+            GROUP BY health_record_id
+        )
+        UPDATE health_records hr
+        SET blood_glucose_records = merged.records
+        FROM health_records r
+        LEFT JOIN merged ON merged.health_record_id = r.id
+        WHERE r.id = hr.id
+          AND (merged.health_record_id IS NOT NULL
+               OR r.patient_id IN (SELECT patient_id FROM blood_glucose_readings))
+    """)
+
+    op.drop_table('blood_glucose_readings_quarantine')
+    op.drop_index('ix_blood_glucose_readings_patient_id_measured_at', table_name='blood_glucose_readings')
+    op.drop_table('blood_glucose_readings')
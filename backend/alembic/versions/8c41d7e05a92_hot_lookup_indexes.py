@@ -0,0 +1,42 @@
+"""hot lookup indexes
+
+Revision ID: 8c41d7e05a92
+Revises: 3f9a6c1d2b7e
+Create Date: 2026-10-18 11:31:05.902114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c41d7e05a92'
+down_revision: Union[str, None] = '3f9a6c1d2b7e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (index name, table, columns)
+INDEXES = [
+    ('ix_health_records_patient_id', 'health_records', ['patient_id']),
+    ('ix_doctors_hospital_id', 'doctors', ['hospital_id']),
+    ('ix_users_role', 'users', ['role']),
+    ('ix_users_created_at_id', 'users', ['created_at', 'id']),
+    ('ix_hospitals_created_at_id', 'hospitals', ['created_at', 'id']),
+    ('ix_health_records_created_at_id', 'health_records', ['created_at', 'id']),
+]
+
+
+def upgrade() -> None:
+    # concurrent index builds can't run inside the migration transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,56 @@
+"""jsonb contact and diabetes fields
+
+Revision ID: b57e2a9c4f10
+Revises: 8c41d7e05a92
+Create Date: 2026-10-18 12:04:51.663027
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b57e2a9c4f10'
+down_revision: Union[str, None] = '8c41d7e05a92'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (table, column, nullable)
+COLUMNS = [
+    ('hospitals', 'emails', False),
+    ('hospitals', 'contact_numbers', False),
+    ('doctors', 'emails', False),
+    ('doctors', 'contact_numbers', False),
+    ('health_records', 'previous_diabetes_records', True),
+]
+
+
+def upgrade() -> None:
+    for table, column, nullable in COLUMNS:
+        op.alter_column(table, column,
+               existing_type=sa.JSON(),
+               type_=postgresql.JSONB(),
+               existing_nullable=nullable,
+               postgresql_using=f'{column}::jsonb')
+
+    # gin indexes w jsonb_path_ops only serve containment (@>) which is all the lookups need
+    with op.get_context().autocommit_block():
+        for table, column, _ in COLUMNS:
+            op.create_index(f'ix_{table}_{column}', table, [column], unique=False, postgresql_using='gin', postgresql_ops={column: 'jsonb_path_ops'}, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for table, column, _ in reversed(COLUMNS):
+            op.drop_index(f'ix_{table}_{column}', table_name=table, postgresql_concurrently=True, if_exists=True)
+
+    for table, column, nullable in reversed(COLUMNS):
+        op.alter_column(table, column,
+               existing_type=postgresql.JSONB(),
+               type_=sa.JSON(),
+               existing_nullable=nullable,
+               postgresql_using=f'{column}::json')
@@ -0,0 +1,31 @@
+"""user polymorphic type
+
+Revision ID: c2d8f3a61e47
+Revises: b57e2a9c4f10
+Create Date: 2026-10-18 13:12:40.215377
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c2d8f3a61e47'
+down_revision: Union[str, None] = 'b57e2a9c4f10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # a constant default keeps this a metadata only change on postgres 11+
+    op.add_column('users', sa.Column('type', sa.String(length=20), server_default='user', nullable=False))
+
+    # existing rows get the identity of the subclass table they live in
+    op.execute("UPDATE users SET type = 'patient' WHERE id IN (SELECT id FROM patients)")
+    op.execute("UPDATE users SET type = 'doctor' WHERE id IN (SELECT id FROM doctors)")
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'type')
@@ -0,0 +1,26 @@
+from typing import List, Tuple
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+# ids bound per statement, keeps huge batches well below the bind parameter limit of postgres
+DELETE_CHUNK_SIZE = 5000
+
+
+
+# delete rows by id w one DELETE ... RETURNING per chunk, no orm object gets loaded
+async def delete_by_ids(model, ids: List[str], db: AsyncSession) -> Tuple[List[str], List[str]]:
+  deleted_ids = []
+
+  for i in range(0, len(ids), DELETE_CHUNK_SIZE):
+    result = await db.execute(
+      delete(model)
+      .where(model.id.in_(ids[i:i + DELETE_CHUNK_SIZE]))
+      .returning(model.id)
+      .execution_options(synchronize_session=False)
+    )
+    deleted_ids.extend(str(id) for id in result.scalars().all())
+
+  missing_ids = list(set(ids) - set(deleted_ids))
+
+  return deleted_ids, missing_ids
@@ -0,0 +1,396 @@
+import os
+import time
+import json
+import asyncio
+import inspect
+import functools
+from collections import OrderedDict
+from typing import Awaitable, Callable, Iterable
+from fastapi.encoders import jsonable_encoder
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.core.redis import redis_client
+from app.core.conditional import make_etag
+from app.core.invalidation import invalidation_bus
+from app.db import SessionLocal
+
+
+# every response cache of the process by namespace, for the statistics endpoint
+caches = {}
+
+
+
+class CacheStats:
+  def __init__(self):
+    self.reset()
+
+  def reset(self):
+    self.hits = 0
+    self.local_hits = 0 # hits served by the in process tier, w/o a round trip to redis
+    self.stale_hits = 0
+    self.misses = 0
+    self.coalesced = 0 # misses that waited for a load already running instead of starting one
+    self.invalidations = 0
+    self.errors = 0
+
+  def snapshot(self):
+    lookups = self.hits + self.stale_hits + self.misses
+
+    return {
+      "pid": os.getpid(), # stats are per worker process
+      "hits": self.hits,
+      "local_hits": self.local_hits,
+      "stale_hits": self.stale_hits,
+      "misses": self.misses,
+      "coalesced": self.coalesced,
+      "hit_ratio": round((self.hits + self.stale_hits) / lookups, 3) if lookups else 0,
+      "invalidations": self.invalidations,
+      "errors": self.errors,
+    }
+
+
+
+# in process lru w a ttl, bounded to maxsize entries (the least recently used one is evicted first)
+class LRUCache:
+  def __init__(self, maxsize: int, ttl: float):
+    self.maxsize = maxsize
+    self.ttl = ttl
+    self.entries = OrderedDict() # key -> (value, expires at)
+    self.evictions = 0
+
+  def get(self, key):
+    entry = self.entries.get(key)
+
+    if entry is None:
+      return None
+
+    value, expires_at = entry
+    if expires_at < time.monotonic():
+      del self.entries[key]
+      return None
+
+    self.entries.move_to_end(key)
+    return value
+
+  def set(self, key, value):
+    self.entries[key] = (value, time.monotonic() + self.ttl)
+    self.entries.move_to_end(key)
+
+    while len(self.entries) > self.maxsize:
+      self.entries.popitem(last=False)
+      self.evictions += 1
+
+  def delete(self, key):
+    self.entries.pop(key, None)
+
+  def clear(self):
+    self.entries.clear()
+
+  def __len__(self):
+    return len(self.entries)
+
+
+
+# two tier read-through cache of json responses, an in process lru (l1) in front of redis (l2).
+# entries carry tags (e.g. the ids of the rows they were built from) so a write drops exactly the
+# entries showing what it changed. concurrent misses of a key share a single load (single-flight)
+# n w a stale_ttl, expired entries are served a while longer while one request refreshes them in
+# the background (stale-while-revalidate). redis being down only costs the l2, requests fall
+# through to the database
+class ResponseCache:
+  def __init__(
+    self, 
+    namespace: str, 
+    ttl: int | None = None, 
+    stale_ttl: int = 0, 
+    local_ttl: int | None = None, 
+    local_size: int | None = None,
+  ):
+    self.namespace = namespace
+    self.ttl = ttl or settings.cache_ttl
+    self.stale_ttl = stale_ttl
+    # other workers evict their l1 copies through the invalidation bus, its short ttl bounds how stale
+    # they get when a message is lost
+    self.local = LRUCache(local_size or settings.cache_local_size, min(local_ttl or settings.cache_local_ttl, self.ttl))
+    self.stats = CacheStats()
+    self.inflight = {} # key -> task loading it
+    self.generation = 0 # bumped by every invalidation, loads started before one don't store their result
+    caches[namespace] = self
+    invalidation_bus.register(namespace, self)
+
+  def key(self, key: str) -> str:
+    return f'cache:{self.namespace}:{key}'
+
+  def tag_key(self, tag: str) -> str:
+    return f'cache:{self.namespace}:tag:{tag}'
+
+
+  # the cached entry of the key, { "value": ..., "etag": ..., "fresh_until": ... } or none
+  async def lookup(self, key: str):
+    entry = self.local.get(key)
+
+    if entry is not None:
+      self.stats.local_hits += 1
+      return entry
+
+    try:
+      cached = await redis_client.get().get(self.key(key))
+    except RedisError:
+      self.stats.errors += 1
+      return None
+
+    if cached is None:
+      return None
+
+    entry = json.loads(cached)
+    if "etag" not in entry:
+      entry["etag"] = make_etag(entry["value"]) # stored before entries carried their etag
+
+    self.local.set(key, entry)
+    return entry
+
+
+  # return the cached response of the key, or load, store n return it. errors raised by the loader
+  # (e.g. not found) are not cached. the refresher reloads a stale entry outside of the request
+  async def get_or_load(
+    self, 
+    key: str, 
+    loader: Callable[[], Awaitable], 
+    tags: Callable[[dict], Iterable[str]] = None,
+    refresher: Callable[[], Awaitable] = None,
+  ):
+    return (await self.get_entry(key, loader, tags, refresher))["value"]
+
+
+  # same as get_or_load but returns the whole entry, the etag of a hit is known w/o a database query
+  async def get_entry(
+    self, 
+    key: str, 
+    loader: Callable[[], Awaitable], 
+    tags: Callable[[dict], Iterable[str]] = None,
+    refresher: Callable[[], Awaitable] = None,
+  ) -> dict:
+    entry = await self.lookup(key)
+
+    if entry is not None:
+      if entry["fresh_until"] > time.time():
+        self.stats.hits += 1
+        return entry
+
+      # entries stay in redis for the stale window after they expire
+      if refresher and self.stale_ttl:
+        self.stats.stale_hits += 1
+        self.load(key, refresher, tags).add_done_callback(self.refreshed)
+        return entry
+
+    self.stats.misses += 1
+    return await asyncio.shield(self.load(key, loader, tags))
+
+
+  # the task loading the key, concurrent callers share the one already running
+  def load(self, key: str, loader: Callable[[], Awaitable], tags: Callable[[dict], Iterable[str]] = None) -> asyncio.Task:
+    task = self.inflight.get(key)
+
+    if task is not None:
+      self.stats.coalesced += 1
+      return task
+
+    task = asyncio.ensure_future(self.fill(key, loader, tags))
+    self.inflight[key] = task
+    task.add_done_callback(lambda _: self.inflight.pop(key, None))
+    return task
+
+
+  # nobody awaits a background refresh, its failure is only counted (the stale entry expires on its own)
+  def refreshed(self, task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+      self.stats.errors += 1
+
+
+  async def fill(self, key: str, loader: Callable[[], Awaitable], tags: Callable[[dict], Iterable[str]] = None):
+    generation = self.generation
+
+    # encoded once here, every tier n every caller gets the very same json
+    value = jsonable_encoder(await loader())
+    entry = { "value": value, "etag": make_etag(value), "fresh_until": time.time() + self.ttl }
+
+    # invalidated while loading, the value may predate the write
+    if generation != self.generation:
+      return entry
+
+    self.local.set(key, entry)
+
+    try:
+      async with redis_client.get().pipeline(transaction=False) as pipe:
+        pipe.set(self.key(key), json.dumps(entry), ex=self.ttl + self.stale_ttl)
+
+        for tag in tags(value) if tags else []:
+          pipe.sadd(self.tag_key(tag), self.key(key))
+          pipe.expire(self.tag_key(tag), self.ttl + self.stale_ttl)
+
+        await pipe.execute()
+    except RedisError:
+      self.stats.errors += 1
+
+    return entry
+
+
+  # drop the given keys n every entry tagged w one of the given tags
+  async def invalidate(self, keys: Iterable[str] = (), tags: Iterable[str] = ()):
+    self.generation += 1
+    keys = [self.key(key) for key in keys]
+    tag_keys = [self.tag_key(tag) for tag in tags]
+
+    try:
+      redis = redis_client.get()
+
+      if tag_keys:
+        async with redis.pipeline(transaction=False) as pipe:
+          for tag_key in tag_keys:
+            pipe.smembers(tag_key)
+          for members in await pipe.execute():
+            keys.extend(members)
+
+      if keys or tag_keys:
+        await redis.delete(*keys, *tag_keys)
+    except RedisError:
+      # w/o the tag sets the affected l1 entries are unknown, the l2 ones expire w the ttl
+      self.clear_local()
+      self.stats.errors += 1
+      return
+
+    # the tag members are resolved here, the other workers get the plain keys to evict
+    prefix = self.key('')
+    keys = [key.removeprefix(prefix) for key in keys]
+    self.evict_local(keys)
+    await invalidation_bus.publish(self.namespace, keys)
+
+    self.stats.invalidations += 1
+
+
+  # drop entries of the in process tier only, for invalidations published by other workers
+  def evict_local(self, keys: Iterable[str]):
+    self.generation += 1
+    for key in keys:
+      self.local.delete(key)
+
+
+  def clear_local(self):
+    self.generation += 1
+    self.local.clear()
+
+
+  def snapshot(self):
+    return {
+      "ttl": self.ttl,
+      "stale_ttl": self.stale_ttl,
+      "local_ttl": self.local.ttl,
+      "local_size": len(self.local),
+      "local_max_size": self.local.maxsize,
+      "local_evictions": self.local.evictions,
+      **self.stats.snapshot(),
+    }
+
+
+
+# ids recently looked up n not found, consulted before the database so unknown or mistyped ids (e.g.
+# short urls enumerated by scrapers) cost no query. only kept in process, briefly n bounded in size.
+# rows created w an id evict it on every worker through the invalidation bus
+class NegativeCache:
+  def __init__(self, namespace: str, ttl: int | None = None, size: int | None = None):
+    self.namespace = f'missing:{namespace}'
+    self.local = LRUCache(size or settings.negative_cache_size, ttl or settings.negative_cache_ttl)
+    self.negative_hits = 0 # lookups answered as not found w/o a query
+    self.recorded = 0
+    self.invalidations = 0
+    caches[self.namespace] = self
+    invalidation_bus.register(self.namespace, self)
+
+
+  def contains(self, id) -> bool:
+    if self.local.get(str(id)) is None:
+      return False
+
+    self.negative_hits += 1
+    return True
+
+
+  def add(self, id):
+    self.local.set(str(id), True)
+    self.recorded += 1
+
+
+  # called after rows w the given ids were created
+  async def discard(self, ids: list):
+    if not ids:
+      return
+
+    self.evict_local(ids)
+    await invalidation_bus.publish(self.namespace, ids)
+    self.invalidations += 1
+
+
+  def evict_local(self, ids: list):
+    for id in ids:
+      self.local.delete(str(id))
+
+
+  def clear_local(self):
+    self.local.clear()
+
+
+  def snapshot(self):
+    return {
+      "pid": os.getpid(), # stats are per worker process
+      "ttl": self.local.ttl,
+      "size": len(self.local),
+      "max_size": self.local.maxsize,
+      "evictions": self.local.evictions,
+      "negative_hits": self.negative_hits,
+      "recorded": self.recorded,
+      "invalidations": self.invalidations,
+    }
+
+
+
+# cache the response of an async service method. the key is a format string (or a callable) over the
+# arguments of the method, e.g. @cached(hospital_cache, 'all:{offset}:{limit}:{cursor}'), tags get the
+# response n the arguments. method.entry(...) returns the cache entry (value n etag) instead. a load is
+# shared w concurrent callers n may outlive the request that started it (a disconnect cancels only
+# the waiting, or it refreshes a stale entry in the background), so it never borrows the session of
+# the request but opens one of its own on the same engine
+def cached(cache: ResponseCache, key: str | Callable[..., str], tags: Callable[[dict], Iterable[str]] = None):
+  def decorator(method):
+    signature = inspect.signature(method)
+
+    # the whole cache entry, for handlers answering conditional requests (see app.core.conditional)
+    async def entry(*args, **kwargs) -> dict:
+      bound = signature.bind(*args, **kwargs)
+      bound.apply_defaults()
+      arguments = bound.arguments
+
+      cache_key = key(**arguments) if callable(key) else key.format(**arguments)
+      loader = lambda: method(*bound.args, **bound.kwargs)
+
+      # shared entries are filled from the primary, a lagging replica would cache again the rows
+      # a write just invalidated
+      if 'db' in arguments:
+        async def loader():
+          async with SessionLocal() as db:
+            return await method(**{ **arguments, "db": db })
+
+      return await cache.get_entry(
+        cache_key, 
+        loader, 
+        (lambda value: tags(value, **arguments)) if tags else None, 
+        loader
+      )
+
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+      return (await entry(*args, **kwargs))["value"]
+
+    wrapper.entry = entry
+    return wrapper
+  return decorator
@@ -0,0 +1,49 @@
+import json
+import hashlib
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
+
+from app.core.config import settings
+
+
+
+# strong etag of a json ready value, a hash of the exact body it is sent as
+def make_etag(value) -> str:
+  body = json.dumps(value, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+  return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+
+# if-none-match lists one or more (possibly weak) etags, or *
+def etag_matches(request: Request, etag: str) -> bool:
+  header = request.headers.get('if-none-match')
+
+  if not header:
+    return False
+
+  candidates = [candidate.strip().removeprefix('W/') for candidate in header.split(',')]
+  return '*' in candidates or etag in candidates
+
+
+
+# answer a get w the json of the value n its etag, or w a bodiless 304 when the client already has
+# this version. cached responses pass the etag stored next to them, so a hit isn't even serialized.
+# shared responses (the same for every caller) may also be kept a few seconds by the nginx micro-cache
+def conditional_response(request: Request, value, etag: str | None = None, shared: bool = False) -> Response:
+  if etag is None:
+    value = jsonable_encoder(value)
+    etag = make_etag(value)
+
+  # clients may reuse their copy but have to revalidate it first
+  cache_control = "no-cache"
+  if shared:
+    # max-age=0 keeps browsers revalidating, s-maxage n stale-while-revalidate only apply to nginx
+    cache_control = f"public, max-age=0, s-maxage={settings.edge_cache_ttl}, stale-while-revalidate={settings.edge_cache_stale_ttl}"
+
+  headers = { "ETag": etag, "Cache-Control": cache_control }
+
+  if etag_matches(request, etag):
+    return Response(status_code=304, headers=headers)
+
+  return JSONResponse(content=value, headers=headers)
@@ -1,40 +1,43 @@
-import redis
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from app.core.security import verify_token
+from app.core.security import verify_token, verify_token_claims
 from app.core.utils import ResponseHandler
 from app.db import get_db
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.config import settings
+from app.core.redis import redis_client
 from app.models import Patient
 
 oauth2_scheme = HTTPBearer()
 
-def include_auth(db: Session = Depends(get_db), credentials: HTTPAuthorizationCredentials = Depends(oauth2_scheme)):
+async def include_auth(db: AsyncSession = Depends(get_db), credentials: HTTPAuthorizationCredentials = Depends(oauth2_scheme)):
   if credentials.scheme != "Bearer":
     raise ResponseHandler.invalid_token()
   
-  user = verify_token(credentials.credentials, db)
+  user = await verify_token(credentials.credentials, db)
   
   if not user:
     raise ResponseHandler.invalid_token()
   
-  patient = db.query(Patient).where(Patient.id == user.id).first()
-
-  if not patient:
+  # the principal is already loaded as its subclass, no second query for the patient row
+  if not isinstance(user, Patient):
     raise HTTPException(
       status_code=400,
       detail='something went wrong!'
     )
   
-  return patient
+  return user
 
 
-def include_admin(db: Session = Depends(get_db), credentials: HTTPAuthorizationCredentials = Depends(oauth2_scheme)):
+async def include_admin(db: AsyncSession = Depends(get_db), credentials: HTTPAuthorizationCredentials = Depends(oauth2_scheme)):
   if credentials.scheme != "Bearer":
     raise ResponseHandler.invalid_token()
   
-  user = verify_token(credentials.credentials, db)
+  # the role is signed into the token, no database hit just to authorize
+  if settings.jwt_stateless_auth:
+    user = await verify_token_claims(credentials.credentials, db)
+  else:
+    user = await verify_token(credentials.credentials, db)
   
   if not user:
     raise ResponseHandler.invalid_token()
@@ -46,8 +49,6 @@ def include_admin(db: Session = Depends(get_db), credentials: HTTPAuthorizationC
   return user 
 
 
+# the process wide async redis client, no new connection per request
 def cache():
-  return redis.Redis(
-    host=settings.redis_host,
-    port=settings.redis_port,
-  )
\ No newline at end of file
+  return redis_client.get()
@@ -0,0 +1,98 @@
+import os
+import time
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.core.security import generate_hash, verify_password
+
+
+
+# bcrypt on a bounded pool of worker processes so hashing never blocks the event loop
+class PasswordHasher:
+  def __init__(self):
+    self.executor = None
+    self.reset()
+
+  def reset(self):
+    self.in_flight = 0
+    self.max_in_flight = 0
+    self.completed = 0
+    self.rejected = 0
+    self.total_ms = 0.0
+    self.max_ms = 0.0
+
+
+  def start(self):
+    if self.executor is None:
+      # spawned (not forked) workers, forking a process running an event loop n threads isn't safe
+      self.executor = ProcessPoolExecutor(
+        max_workers=settings.hash_workers,
+        mp_context=multiprocessing.get_context('spawn')
+      )
+    return self.executor
+
+
+  # warm every worker up front so the first logins don't pay for the process startup
+  async def warm_up(self):
+    loop = asyncio.get_running_loop()
+    executor = self.start()
+    await asyncio.gather(*(loop.run_in_executor(executor, os.getpid) for _ in range(settings.hash_workers)))
+
+
+  def shutdown(self):
+    if self.executor is not None:
+      self.executor.shutdown(wait=False, cancel_futures=True)
+      self.executor = None
+
+
+  async def run(self, fn, *args):
+    # shed load once the queue is full instead of letting every request wait behind it
+    if self.in_flight >= settings.hash_max_queue:
+      self.rejected += 1
+      raise HTTPException(
+        status_code=503,
+        detail='server is busy, try again later!',
+        headers={"Retry-After": "1"}
+      )
+
+    self.in_flight += 1
+    self.max_in_flight = max(self.max_in_flight, self.in_flight)
+    start_time = time.perf_counter()
+
+    try:
+      return await asyncio.get_running_loop().run_in_executor(self.start(), fn, *args)
+    finally:
+      elapsed_ms = (time.perf_counter() - start_time) * 1000
+      self.in_flight -= 1
+      self.completed += 1
+      self.total_ms += elapsed_ms
+      self.max_ms = max(self.max_ms, elapsed_ms)
+
+
+  async def hash(self, text: str) -> str:
+    return await self.run(generate_hash, text)
+
+
+  async def verify(self, plain_password: str, hashed_password: str) -> bool:
+    return await self.run(verify_password, plain_password, hashed_password)
+
+
+  def snapshot(self):
+    return {
+      "pid": os.getpid(), # stats are per worker process
+      "workers": settings.hash_workers,
+      "max_queue": settings.hash_max_queue,
+      "in_flight": self.in_flight,
+      "max_in_flight": self.max_in_flight,
+      "completed": self.completed,
+      "rejected": self.rejected,
+      "avg_ms": round(self.total_ms / self.completed, 3) if self.completed else 0,
+      "max_ms": round(self.max_ms, 3),
+    }
+
+
+
+hasher = PasswordHasher()
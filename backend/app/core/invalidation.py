@@ -0,0 +1,120 @@
+import os
+import json
+import asyncio
+from uuid import uuid4
+from redis.exceptions import RedisError
+
+from app.core.redis import redis_client
+
+
+# every api worker of every replica subscribes to this channel
+INVALIDATION_CHANNEL = 'cache:invalidations'
+
+# seconds to wait before subscribing again after losing the connection to redis
+RESUBSCRIBE_DELAY = 1
+
+
+
+# keeps the in process cache tiers of all workers coherent. a cache evicting entries after a write
+# publishes their keys n every other worker drops its own copies. pub/sub is fire n forget, so a
+# worker that (re)subscribes clears its tiers, it may have missed messages meanwhile
+class InvalidationBus:
+  def __init__(self):
+    self.origin = uuid4().hex # tells the messages of this worker apart from the others
+    self.caches = {} # name -> cache w evict_local(keys) n clear_local()
+    self.task = None
+    self.running = False
+    self.published = 0
+    self.received = 0
+    self.resubscriptions = 0
+    self.errors = 0
+
+  def register(self, name: str, cache):
+    self.caches[name] = cache
+
+
+  async def publish(self, name: str, keys: list):
+    if not keys:
+      return
+
+    message = json.dumps({ "origin": self.origin, "cache": name, "keys": [str(key) for key in keys] })
+
+    try:
+      await redis_client.get().publish(INVALIDATION_CHANNEL, message)
+    except RedisError:
+      # the other workers fall back on the short ttl of their in process tiers
+      self.errors += 1
+      return
+
+    self.published += 1
+
+
+  def dispatch(self, data: str):
+    event = json.loads(data)
+
+    if event["origin"] == self.origin:
+      return
+
+    cache = self.caches.get(event["cache"])
+    if cache is not None:
+      cache.evict_local(event["keys"])
+      self.received += 1
+
+
+  def clear_all(self):
+    for cache in self.caches.values():
+      cache.clear_local()
+
+
+  async def listen(self):
+    while self.running:
+      try:
+        async with redis_client.get().pubsub() as pubsub:
+          await pubsub.subscribe(INVALIDATION_CHANNEL)
+          self.clear_all()
+
+          # polled rather than blocking, so the socket timeout doesn't apply n stop() is noticed
+          while self.running:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            if message is not None:
+              self.dispatch(message["data"])
+      except (RedisError, OSError, ValueError):
+        self.errors += 1
+
+      if self.running:
+        self.resubscriptions += 1
+        await asyncio.sleep(RESUBSCRIBE_DELAY)
+
+
+  def start(self):
+    if self.task is None:
+      self.running = True
+      self.task = asyncio.create_task(self.listen())
+
+
+  # the listener leaves its loop w/in a poll interval, it is only cancelled if it doesn't
+  async def stop(self):
+    if self.task is not None:
+      task, self.task = self.task, None
+      self.running = False
+
+      await asyncio.wait([task], timeout=RESUBSCRIBE_DELAY + 1)
+      if not task.done():
+        task.cancel()
+
+
+  def snapshot(self):
+    return {
+      "pid": os.getpid(), # stats are per worker process
+      "origin": self.origin,
+      "listening": self.task is not None and not self.task.done(),
+      "caches": list(self.caches),
+      "published": self.published,
+      "received": self.received,
+      "resubscriptions": self.resubscriptions,
+      "errors": self.errors,
+    }
+
+
+
+invalidation_bus = InvalidationBus()
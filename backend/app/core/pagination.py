@@ -0,0 +1,55 @@
+import base64
+import json
+from datetime import datetime
+from uuid import UUID
+from fastapi import HTTPException
+from sqlalchemy import Select, tuple_, inspect
+
+
+
+# encode the sort key of the last row into an opaque cursor
+def encode_cursor(created_at: datetime, id: UUID) -> str:
+  raw = json.dumps([created_at.isoformat(), str(id)], separators=(',', ':'))
+  return base64.urlsafe_b64encode(raw.encode()).rstrip(b'=').decode('ascii')
+
+
+
+# decode a cursor back into its (created_at, id) sort key
+def decode_cursor(cursor: str):
+  try:
+    padding = '=' * (-len(cursor) % 4)
+    created_at, id = json.loads(base64.urlsafe_b64decode(cursor + padding))
+
+    return datetime.fromisoformat(created_at), UUID(id)
+  except Exception:
+    raise HTTPException(
+      status_code=400,
+      detail='invalid pagination cursor!'
+    )
+
+
+
+# apply keyset pagination ordered by created_at + id, offset is kept as a fallback for older clients
+def paginate(query: Select, model, offset: int | None, limit: int | None, cursor: str | None) -> Select:
+  if offset is not None and not cursor:
+    return query.offset(offset).limit(limit)
+
+  # subclasses (doctors, patients) sort on the users table so one index covers every listing
+  base = inspect(model).base_mapper.class_
+  query = query.order_by(base.created_at, base.id).limit(limit)
+
+  if cursor:
+    created_at, id = decode_cursor(cursor)
+    query = query.where(tuple_(base.created_at, base.id) > (created_at, id))
+
+  return query
+
+
+
+# cursor of the next page, none when the current page is the last one
+def next_cursor(rows, limit: int | None, offset: int | None = None, cursor: str | None = None):
+  if (offset is not None and not cursor) or not limit or len(rows) < limit:
+    return None
+
+  last = rows[-1]
+  return encode_cursor(last.created_at, last.id)
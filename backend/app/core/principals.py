@@ -0,0 +1,135 @@
+import json
+from uuid import UUID
+from datetime import datetime
+from typing import Awaitable, Callable
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import DateTime, Uuid, inspect
+from redis.exceptions import RedisError
+
+from app.models import User, Patient, Doctor
+from app.core.config import settings
+from app.core.redis import redis_client
+from app.core.cache import LRUCache, CacheStats, caches
+from app.core.invalidation import invalidation_bus
+
+
+PRINCIPAL_CLASSES = { 'user': User, 'patient': Patient, 'doctor': Doctor }
+
+
+
+# column values of a loaded principal, the password never leaves the database
+def principal_columns(user: User) -> dict:
+  return { attr.key: getattr(user, attr.key) for attr in inspect(user).mapper.column_attrs if attr.key != 'password' }
+
+
+
+# turn the json of a cached principal back into column values (uuids n datetimes are strings in json)
+def restore_columns(columns: dict) -> dict:
+  mapper = inspect(PRINCIPAL_CLASSES.get(columns.get('type'), User))
+
+  for attr in mapper.column_attrs:
+    val = columns.get(attr.key)
+    if val is None:
+      continue
+
+    column_type = attr.columns[0].type
+    if isinstance(column_type, Uuid):
+      columns[attr.key] = UUID(val)
+    elif isinstance(column_type, DateTime):
+      columns[attr.key] = datetime.fromisoformat(val)
+
+  return columns
+
+
+
+# the authenticated users by id, an in process lru in front of redis in front of the database. every
+# request gets its own (detached) instance, so changes made to it never leak into the cache
+class PrincipalCache:
+  def __init__(self):
+    self.local = LRUCache(settings.principal_cache_size, settings.principal_cache_ttl)
+    self.stats = CacheStats()
+    caches['principals'] = self
+    invalidation_bus.register('principals', self)
+
+  def key(self, user_id) -> str:
+    return f'auth:principal:{user_id}'
+
+
+  async def get(self, user_id: str, loader: Callable[[], Awaitable[User | None]]) -> User | None:
+    user_id = str(user_id)
+    columns = self.local.get(user_id)
+
+    if columns is not None:
+      self.stats.local_hits += 1
+      self.stats.hits += 1
+      return self.build(columns)
+
+    try:
+      cached = await redis_client.get().get(self.key(user_id))
+    except RedisError:
+      self.stats.errors += 1
+      cached = None
+
+    if cached is not None:
+      self.stats.hits += 1
+      columns = restore_columns(json.loads(cached))
+    else:
+      self.stats.misses += 1
+      user = await loader()
+
+      if user is None:
+        return None
+
+      columns = principal_columns(user)
+      try:
+        await redis_client.get().set(self.key(user_id), json.dumps(jsonable_encoder(columns)), ex=settings.principal_cache_ttl)
+      except RedisError:
+        self.stats.errors += 1
+
+    self.local.set(user_id, columns)
+    return self.build(columns)
+
+
+  def build(self, columns: dict) -> User:
+    return PRINCIPAL_CLASSES.get(columns['type'], User)(**columns)
+
+
+  # drop the users from both tiers, called after their accounts were updated or deleted
+  async def invalidate(self, user_ids: list):
+    if not user_ids:
+      return
+
+    self.evict_local(user_ids)
+
+    try:
+      await redis_client.get().delete(*(self.key(user_id) for user_id in user_ids))
+    except RedisError:
+      # other workers keep their copy until the ttl runs out anyway
+      self.stats.errors += 1
+      return
+
+    await invalidation_bus.publish('principals', user_ids)
+    self.stats.invalidations += 1
+
+
+  def evict_local(self, user_ids: list):
+    for user_id in user_ids:
+      self.local.delete(str(user_id))
+
+
+  def clear_local(self):
+    self.local.clear()
+
+
+  def snapshot(self):
+    return {
+      "ttl": settings.principal_cache_ttl,
+      "size": len(self.local),
+      "max_size": self.local.maxsize,
+      "evictions": self.local.evictions,
+      **self.stats.snapshot(),
+    }
+
+
+
+principals = PrincipalCache()
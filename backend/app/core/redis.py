@@ -0,0 +1,97 @@
+import os
+import time
+import asyncio
+from redis import asyncio as aioredis
+from redis.exceptions import ConnectionError
+
+from app.core.config import settings
+from app.db.pool import PoolStats
+
+
+
+class RedisPoolStats(PoolStats):
+  def snapshot(self, pool):
+    observed = self.checkouts + self.timeouts
+
+    return {
+      "pid": os.getpid(), # stats are per worker process
+      "max_connections": pool.max_connections,
+      "timeout": pool.timeout,
+      "in_use": len(pool._in_use_connections),
+      "idle": len(pool._available_connections),
+      "checkouts": self.checkouts,
+      "timeouts": self.timeouts,
+      "avg_wait_ms": round(self.total_wait_ms / observed, 3) if observed else 0,
+      "max_wait_ms": round(self.max_wait_ms, 3),
+      "wait_histogram": self.histogram(),
+    }
+
+
+
+# blocking pool (waits for a free connection instead of failing right away) that measures every checkout
+class ObservedConnectionPool(aioredis.BlockingConnectionPool):
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.stats = RedisPoolStats()
+
+  async def get_connection(self, *args, **kwargs):
+    start_time = time.perf_counter()
+
+    try:
+      connection = await super().get_connection(*args, **kwargs)
+    except ConnectionError as e:
+      # only a pool timeout counts, a refused connection is the server's fault not the pool's
+      if isinstance(e.__cause__, asyncio.TimeoutError):
+        self.stats.observe((time.perf_counter() - start_time) * 1000, timed_out=True)
+      raise
+
+    self.stats.observe((time.perf_counter() - start_time) * 1000)
+    return connection
+
+  def snapshot(self):
+    return self.stats.snapshot(self)
+
+
+
+# one async client per process, every request shares its connection pool
+class RedisClient:
+  def __init__(self):
+    self.client = None
+
+  def start(self):
+    if self.client is None:
+      pool = ObservedConnectionPool(
+        host=settings.redis_host,
+        port=settings.redis_port,
+        password=settings.redis_password or None, # empty when redis runs w/o requirepass (see compose.yaml)
+        max_connections=settings.redis_max_connections,
+        timeout=settings.redis_pool_timeout,
+        socket_timeout=settings.redis_socket_timeout,
+        socket_connect_timeout=settings.redis_socket_timeout,
+        health_check_interval=30,
+        decode_responses=True,
+      )
+      self.client = aioredis.Redis(connection_pool=pool)
+    return self.client
+
+
+  # the client is created on first use too, so code running outside the app lifespan (scripts, workers) works
+  def get(self) -> aioredis.Redis:
+    return self.start()
+
+
+  async def close(self):
+    if self.client is not None:
+      client, self.client = self.client, None
+      await client.aclose()
+      await client.connection_pool.disconnect()
+
+
+  def snapshot(self):
+    if self.client is None:
+      return None
+    return self.client.connection_pool.snapshot()
+
+
+
+redis_client = RedisClient()
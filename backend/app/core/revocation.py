@@ -0,0 +1,214 @@
+import time
+import asyncio
+import hashlib
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.core.redis import redis_client
+
+
+# jti -> revocation time of the token (logout)
+REVOKED_TOKENS_KEY = 'auth:revoked:tokens'
+
+# user id -> revocation time, every token issued to the user before it is rejected (role change, deleted account)
+REVOKED_SUBJECTS_KEY = 'auth:revoked:subjects'
+
+# 1mb of bits n 7 hashes keep false positives below 0.1% for up to 500k live revocations
+BLOOM_FILTER_BITS = 1 << 23
+BLOOM_FILTER_HASHES = 7
+
+# seconds an incremental sync reaches back before the previous one, covers revocations written by
+# workers whose clock runs a little behind (adding an entry twice to the filter is harmless)
+SYNC_OVERLAP = 5
+
+# seconds between full rebuilds of the bloom filter, drops the revocations expired meanwhile
+REBUILD_INTERVAL = 3600
+
+
+
+class BloomFilter:
+  def __init__(self, size: int = BLOOM_FILTER_BITS, hashes: int = BLOOM_FILTER_HASHES):
+    self.size = size
+    self.hashes = hashes
+    self.bits = bytearray(size // 8 + 1)
+
+  # double hashing, every position derived from a single blake2b digest
+  def positions(self, item: str):
+    digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], 'little')
+    h2 = int.from_bytes(digest[8:], 'little') | 1
+    return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+  def add(self, item: str):
+    for position in self.positions(item):
+      self.bits[position >> 3] |= 1 << (position & 7)
+
+  def __contains__(self, item: str) -> bool:
+    return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(item))
+
+
+
+def build_bloom(tokens: list, subjects: list) -> BloomFilter:
+  bloom = BloomFilter()
+
+  for jti in tokens:
+    bloom.add(f'jti:{jti}')
+  for subject in subjects:
+    bloom.add(f'sub:{subject}')
+
+  return bloom
+
+
+
+# revoked tokens n subjects live in redis, every process keeps a bloom filter of them so the
+# (overwhelmingly common) check of a token that was never revoked doesn't leave the process. a
+# background task started w the app adds the revocations of other processes every few seconds,
+# only the ones scored after its previous sync are fetched
+class RevocationList:
+  def __init__(self):
+    self.bloom = BloomFilter()
+    self.since = None # revocations scored after this are not in the filter yet, none before the first sync
+    self.synced_at = 0.0
+    self.rebuilt_at = 0.0
+    self.recent = None # revocations of this process made during a rebuild, replayed into the new filter
+    self.task = None
+    self.running = False
+    self.errors = 0
+
+  def client(self):
+    return redis_client.get()
+
+
+  def remember(self, item: str):
+    self.bloom.add(item)
+
+    if self.recent is not None:
+      self.recent.append(item)
+
+
+  # the filter is only trusted while the sync keeps up, otherwise every check asks redis
+  def fresh(self) -> bool:
+    return self.since is not None and time.time() - self.synced_at < 3 * settings.revocation_sync_interval
+
+
+  async def sync(self):
+    now = time.time()
+
+    if self.since is None or now - self.rebuilt_at >= REBUILD_INTERVAL:
+      await self.rebuild(now)
+    else:
+      await self.update(now)
+
+    self.synced_at = now
+
+
+  # fetch the revocations made since the previous sync into the current filter
+  async def update(self, now: float):
+    async with self.client().pipeline(transaction=False) as pipe:
+      pipe.zrangebyscore(REVOKED_TOKENS_KEY, f'({self.since}', '+inf')
+      pipe.zrangebyscore(REVOKED_SUBJECTS_KEY, f'({self.since}', '+inf')
+      tokens, subjects = await pipe.execute()
+
+    for jti in tokens:
+      self.bloom.add(f'jti:{jti}')
+    for subject in subjects:
+      self.bloom.add(f'sub:{subject}')
+
+    self.since = now - SYNC_OVERLAP
+
+
+  # drop the entries that can't match a live token anymore n build a new filter from the rest
+  async def rebuild(self, now: float):
+    max_token_lifetime = (settings.refresh_token_expires + 1) * 86400
+
+    async with self.client().pipeline(transaction=False) as pipe:
+      pipe.zremrangebyscore(REVOKED_TOKENS_KEY, '-inf', now - max_token_lifetime)
+      pipe.zremrangebyscore(REVOKED_SUBJECTS_KEY, '-inf', now - max_token_lifetime)
+      pipe.zrange(REVOKED_TOKENS_KEY, 0, -1)
+      pipe.zrange(REVOKED_SUBJECTS_KEY, 0, -1)
+      _, _, tokens, subjects = await pipe.execute()
+
+    # hashing every entry takes a while, in a thread the event loop keeps serving requests meanwhile
+    self.recent = []
+    try:
+      bloom = await asyncio.to_thread(build_bloom, tokens, subjects)
+      for item in self.recent:
+        bloom.add(item)
+    finally:
+      self.recent = None
+
+    self.bloom = bloom
+    self.since = now - SYNC_OVERLAP
+    self.rebuilt_at = now
+
+
+  async def run(self):
+    while self.running:
+      try:
+        await self.sync()
+      except (RedisError, OSError):
+        # checks fall back on redis until a sync succeeds again
+        self.errors += 1
+
+      await asyncio.sleep(settings.revocation_sync_interval)
+
+
+  def start(self):
+    if self.task is None:
+      self.running = True
+      self.task = asyncio.create_task(self.run())
+
+
+  async def stop(self):
+    if self.task is not None:
+      task, self.task = self.task, None
+      self.running = False
+      task.cancel()
+
+      try:
+        await task
+      except asyncio.CancelledError:
+        pass
+
+
+  # check a decoded token payload, redis is only asked when the bloom filter can't rule it out
+  async def is_revoked(self, payload: dict) -> bool:
+    jti = payload.get('jti')
+    subject = payload.get('sub')
+
+    if self.fresh() and not (jti and f'jti:{jti}' in self.bloom) and f'sub:{subject}' not in self.bloom:
+      return False
+
+    async with self.client().pipeline(transaction=False) as pipe:
+      pipe.zscore(REVOKED_TOKENS_KEY, jti or '')
+      pipe.zscore(REVOKED_SUBJECTS_KEY, subject)
+      token_revoked_at, revoked_at = await pipe.execute()
+
+    if token_revoked_at is not None:
+      return True
+
+    # iat n the revocation time both carry fractions of a second, a token issued right after a role
+    # change stays valid while one issued right before it doesn't
+    return revoked_at is not None and payload.get('iat', 0) <= revoked_at
+
+
+  # revoke a single token (both tokens of a login share the jti), it is kept as long as a token lives
+  async def revoke_token(self, jti: str):
+    await self.client().zadd(REVOKED_TOKENS_KEY, { jti: time.time() })
+    self.remember(f'jti:{jti}')
+
+
+  # revoke every token issued to the users so far
+  async def revoke_subjects(self, user_ids: list):
+    if not user_ids:
+      return
+
+    revoked_at = time.time()
+    await self.client().zadd(REVOKED_SUBJECTS_KEY, { str(user_id): revoked_at for user_id in user_ids })
+
+    for user_id in user_ids:
+      self.remember(f'sub:{user_id}')
+
+
+
+revocations = RevocationList()
@@ -7,12 +7,18 @@ from jwt.exceptions import InvalidTokenError, ExpiredSignatureError
 import base64
 from Crypto.Random import get_random_bytes
 from Crypto.Cipher import AES
-from sqlalchemy.orm import Session, defer
-from uuid import UUID
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer, with_polymorphic
+from uuid import UUID, uuid4
+from redis.exceptions import RedisError
 
 from app.models import User, Patient, Doctor
 from app.core.config import settings
 from app.core.utils import ResponseHandler
+from app.core.revocation import revocations
+from app.core.principals import principals
+from app.schemas.users import TokenClaims
 
 
 
@@ -22,7 +28,7 @@ origins = [origin.strip() for origin in settings.frontend_origins.split(",")]
 
 # generate a hashed password
 def generate_hash(text: str) -> str:
-  salt = bcrypt.gensalt()
+  salt = bcrypt.gensalt(rounds=settings.bcrypt_rounds)
   hashed_text = bcrypt.hashpw(text.encode(), salt)
   return hashed_text.decode()
 
@@ -36,6 +42,15 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
 
 
+# check if a stored hash was made w a different cost than the configured one ($2b$<cost>$<salt n hash>)
+def needs_rehash(hashed_password: str) -> bool:
+  try:
+    return int(hashed_password.split('$')[2]) != settings.bcrypt_rounds
+  except (IndexError, ValueError):
+    return False
+
+
+
 # encrypt a plain text using AES in GCM mode
 def encrypt(plain_text: str, key=settings.hashing_secret_key):
   secret_key = base64.b64decode(key)
@@ -48,6 +63,12 @@ def encrypt(plain_text: str, key=settings.hashing_secret_key):
 
 # decrypt and autheticate an encrypted content using AES in GCM mode (AEAD)
 async def decrypt(encrypted_text: str, key=settings.hashing_secret_key):
+  return decrypt_text(encrypted_text, key)
+
+
+
+# synchronous decryption for code running outside the event loop (worker processes)
+def decrypt_text(encrypted_text: str, key=settings.hashing_secret_key):
   try:
     # convert the key n encryption into bytes 
     secret_key = base64.b64decode(key)
@@ -66,6 +87,15 @@ async def decrypt(encrypted_text: str, key=settings.hashing_secret_key):
     raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"decryption failed {e}")
 
 
+
+# decrypt a client encrypted password n hash it, none if the decryption fails (used by bulk imports)
+def hash_encrypted_password(encrypted_text: str) -> str | None:
+  try:
+    return generate_hash(decrypt_text(encrypted_text))
+  except HTTPException:
+    return None
+
+
 # covert uuid string to short url
 def uuid_to_short_url(uuid_str: str):
   try:
@@ -100,7 +130,8 @@ def short_url_to_uuid(short_url: str):
 # create new token
 def create_access_token(data: dict, expires_delta: datetime) -> str:
   payload = data.copy()
-  payload['iat'] = datetime.now(timezone.utc)
+  # fractional seconds (a valid numericdate), revocations tell tokens of the same second apart
+  payload['iat'] = datetime.now(timezone.utc).timestamp()
   payload['exp'] = expires_delta
 
   return jwt.encode(payload, settings.jwt_secret_key)
@@ -119,16 +150,29 @@ def decode_token(token: str):
 
 
 # verify is the token is valid 
-def verify_token(token: str, db: Session):
+async def verify_token(token: str, db: AsyncSession):
   payload = decode_token(token)
   user_id = payload.get('sub', None)
     
   # check if token payload has the id
   if not user_id:
     raise ResponseHandler.invalid_token()
+
+  # logged out tokens n tokens of users revoked since, the lookup below still catches deleted users w/o redis
+  try:
+    if await revocations.is_revoked(payload):
+      raise ResponseHandler.invalid_token()
+  except RedisError:
+    pass
   
-  # get user w/o passwords, created n updated times 
-  user = db.query(User).filter(User.id == user_id).options(defer(User.password)).first()
+  # get the user w its patient / doctor columns in one query (left outer joins), w/o the password
+  async def load():
+    principal = with_polymorphic(User, [Patient, Doctor])
+    result = await db.execute(select(principal).filter(principal.id == user_id).options(defer(principal.password)))
+    return result.scalars().first()
+
+  # recently authenticated users come from memory (or redis), revoked n deleted ones were rejected above
+  user = await principals.get(user_id, load)
 
   # check if the user exists
   if not user:
@@ -138,9 +182,32 @@ def verify_token(token: str, db: Session):
 
 
 
+# verify the token w/o touching the database, for endpoints that only need the id n the role
+async def verify_token_claims(token: str, db: AsyncSession) -> TokenClaims | User:
+  payload = decode_token(token)
+
+  if not payload.get('sub', None):
+    raise ResponseHandler.invalid_token()
+
+  # tokens issued before the claims were signed in can only be checked against the database
+  if 'role' not in payload or 'type' not in payload:
+    return await verify_token(token, db)
+
+  # w/o redis a revocation can't be ruled out, the database still has the current role
+  try:
+    if await revocations.is_revoked(payload):
+      raise ResponseHandler.invalid_token()
+  except RedisError:
+    return await verify_token(token, db)
+
+  return TokenClaims(id=payload['sub'], role=payload['role'], type=payload['type'])
+
+
+
 # get user access token
 async def get_user_token(user: User | Patient | Doctor, message: str, status_code: int):
-  payload = { "sub": f'{user.id}'}
+  # both tokens of a login share the jti so a logout revokes them together
+  payload = { "sub": f'{user.id}', "role": user.role, "type": user.type, "jti": uuid4().hex }
 
   # generate the token exipirations
   access_token_expires = datetime.now(timezone.utc) + timedelta(minutes=15) + timedelta(minutes=settings.access_token_expires)
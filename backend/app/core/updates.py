@@ -0,0 +1,35 @@
+from sqlalchemy import inspect, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+# update a row w one UPDATE ... WHERE ... RETURNING per table of the model (users + the subclass table for
+# doctors n patients). extra conditions (e.g. ownership) go into the where clause of the first statement so the
+# check n the update are a single round trip, tables w/o a changed column are read w a plain select instead.
+# returns the merged row (password hashes are never returned) or none when no row matched the conditions
+async def update_returning(model, id, payload: dict, db: AsyncSession, *conditions, returning=()):
+  tables = inspect(model).tables
+  row = {}
+
+  for i, table in enumerate(tables):
+    values = { key: val for key, val in payload.items() if key in table.c }
+    columns = [column for column in table.c if column.key != 'password']
+    where = [table.c.id == id, *(conditions if i == 0 else ())]
+
+    # extra returned expressions (e.g. a related row as json) ride along w the last statement
+    if i == len(tables) - 1:
+      columns.extend(returning)
+
+    if values:
+      statement = update(table).where(*where).values(values).returning(*columns)
+    else:
+      statement = select(*columns).where(*where)
+
+    result = await db.execute(statement)
+    returned = result.mappings().first()
+
+    if returned is None:
+      return None
+
+    row.update(returned)
+
+  return row
@@ -1,19 +1,63 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from typing import Generator
+import time
+from fastapi import Request, Depends
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import NullPool
+from typing import AsyncGenerator
 from app.core.config import settings
+from app.db.pool import ObservedQueuePool
 
 
-DATABASE_URL = f"postgresql://{settings.postgres_user}:{settings.postgres_pass}@{settings.postgres_host}:{settings.postgres_port}/{settings.postgres_database_name}"
+DATABASE_URL = f"postgresql+asyncpg://{settings.postgres_user}:{settings.postgres_pass}@{settings.postgres_host}:{settings.postgres_port}/{settings.postgres_database_name}"
+
+# cookie that pins a client to the primary right after one of its own writes
+PRIMARY_PIN_COOKIE = 'db_primary_until'
+
+
+def create_engine(url: str):
+  return create_async_engine(
+    url,
+    poolclass=ObservedQueuePool,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_pre_ping=settings.db_pool_pre_ping, # drop dead connections after a postgres restart
+    pool_recycle=settings.db_pool_recycle,
+  )
+
 
 engine = create_engine(DATABASE_URL)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# optional streaming replica for the read only handlers, everything falls back to the primary w/o it
+replica_engine = create_engine(settings.postgres_replica_url) if settings.postgres_replica_url else None
+
+# keep the loaded attributes after commit, lazy refreshes are not allowed on async sessions
+SessionLocal = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False, class_=AsyncSession)
+ReplicaSessionLocal = async_sessionmaker(bind=replica_engine or engine, autoflush=False, expire_on_commit=False, class_=AsyncSession)
+
+# celery tasks run each job in a fresh event loop, pooled asyncpg connections can't cross loops
+TaskSessionLocal = async_sessionmaker(bind=create_async_engine(DATABASE_URL, poolclass=NullPool), autoflush=False, expire_on_commit=False, class_=AsyncSession)
+
 
 # connect the database using the local session
-def get_db() -> Generator:
-  db = SessionLocal()
-  try: 
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
+  async with SessionLocal() as db:
     yield db
-  finally:
-    db.close()
+
+
+# check if the client wrote something recently enough that the replica may still lag behind
+def pinned_to_primary(request: Request) -> bool:
+  try:
+    return float(request.cookies.get(PRIMARY_PIN_COOKIE, 0)) > time.time()
+  except ValueError:
+    return False
+
+
+# connect the database for read only handlers, served by the replica when there is one. otherwise the
+# session of get_db is reused, the auth dependencies of the request already hold it
+async def get_read_db(request: Request, db: AsyncSession = Depends(get_db)) -> AsyncGenerator[AsyncSession, None]:
+  if replica_engine is None or pinned_to_primary(request):
+    yield db
+    return
+
+  async with ReplicaSessionLocal() as replica:
+    yield replica
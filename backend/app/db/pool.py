@@ -0,0 +1,78 @@
+import os
+import time
+from bisect import bisect_left
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+# upper bounds (ms) of the checkout wait time histogram buckets
+WAIT_BUCKETS_MS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+
+
+class PoolStats:
+  def __init__(self):
+    self.reset()
+
+  def reset(self):
+    self.checkouts = 0
+    self.timeouts = 0
+    self.total_wait_ms = 0.0
+    self.max_wait_ms = 0.0
+    self.buckets = [0] * (len(WAIT_BUCKETS_MS) + 1) # last bucket catches everything above the highest bound
+
+  # record how long a single checkout waited for a connection
+  def observe(self, wait_ms: float, timed_out: bool = False):
+    if timed_out:
+      self.timeouts += 1
+    else:
+      self.checkouts += 1
+
+    self.total_wait_ms += wait_ms
+    self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+    self.buckets[bisect_left(WAIT_BUCKETS_MS, wait_ms)] += 1
+
+  def histogram(self):
+    labels = [f"le_{bound}ms" for bound in WAIT_BUCKETS_MS] + ["inf"]
+    return dict(zip(labels, self.buckets))
+
+  def snapshot(self, pool):
+    observed = self.checkouts + self.timeouts
+
+    return {
+      "pid": os.getpid(), # stats are per worker process
+      "pool_size": pool.size(),
+      "checked_in": pool.checkedin(),
+      "checked_out": pool.checkedout(),
+      "overflow": pool.overflow(),
+      "max_overflow": pool._max_overflow,
+      "timeout": pool.timeout(),
+      "checkouts": self.checkouts,
+      "timeouts": self.timeouts,
+      "avg_wait_ms": round(self.total_wait_ms / observed, 3) if observed else 0,
+      "max_wait_ms": round(self.max_wait_ms, 3),
+      "wait_histogram": self.histogram(),
+    }
+
+
+
+# queue pool that measures the time each checkout spends waiting for (or opening) a connection
+class ObservedQueuePool(AsyncAdaptedQueuePool):
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.stats = PoolStats() # every engine (primary, replica) keeps its own numbers
+
+  def connect(self):
+    start_time = time.perf_counter()
+
+    try:
+      connection = super().connect()
+    except exc.TimeoutError:
+      self.stats.observe((time.perf_counter() - start_time) * 1000, timed_out=True)
+      raise
+
+    self.stats.observe((time.perf_counter() - start_time) * 1000)
+    return connection
+
+  def snapshot(self):
+    return self.stats.snapshot(self)
@@ -1,11 +1,16 @@
 from fastapi import FastAPI, Depends, HTTPException, Request
 from fastapi.responses import JSONResponse 
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 
 from app.routers import patients, auth, health, hospital, doctor
-from app.routers.admin import patients as patients_admin, users, hospitals as hospitals_admin, doctors as doctors_admin
+from app.routers.admin import patients as patients_admin, users, hospitals as hospitals_admin, doctors as doctors_admin, database as database_admin, system as system_admin
 from app.core.security import origins
 from app.core.dependecies import include_admin
+from app.core.hashing import hasher
+from app.core.redis import redis_client
+from app.core.invalidation import invalidation_bus
+from app.core.revocation import revocations
 
 from app.core.config import settings
 from app.workers.celery import celery
@@ -13,14 +18,32 @@ from app.workers.tasks import send_email_task
 
 import httpx
 import json
+import time
+from app.db import replica_engine, PRIMARY_PIN_COOKIE
 from app.core.dependecies import cache 
 from app.core.utils import ResponseHandler
-from redis import Redis
+from redis.asyncio import Redis
 
 
 version = 'v1'
 
+
+# start the shared resources of a worker n release them on shutdown
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+  redis_client.start()
+  revocations.start()
+  invalidation_bus.start()
+  await hasher.warm_up()
+  yield
+  hasher.shutdown()
+  await invalidation_bus.stop()
+  await revocations.stop()
+  await redis_client.close()
+
+
 app = FastAPI(
+  lifespan=lifespan,
   root_path=f'/api/{version}',
   docs_url=f"/docs", openapi_url=f"/openapi.json",
   title='Gluco Guide Backend',
@@ -41,6 +64,23 @@ app.add_middleware(
 )
 
 
+# keep a client on the primary for a moment after its own writes, so it reads what it just wrote
+@app.middleware('http')
+async def pin_writers_to_primary(request: Request, call_next):
+  response = await call_next(request)
+
+  if replica_engine is not None and request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+    response.set_cookie(
+      PRIMARY_PIN_COOKIE, 
+      str(time.time() + settings.read_your_writes_window), 
+      max_age=settings.read_your_writes_window, 
+      httponly=True, 
+      samesite='lax'
+    )
+
+  return response
+
+
 # custom exception handler 
 @app.exception_handler(HTTPException)
 async def custom_http_exception_handler(_: Request, exc: HTTPException):
@@ -58,15 +98,15 @@ async def custom_http_exception_handler(_: Request, exc: HTTPException):
 async def read_redis_entries(
   redis: Redis = Depends(cache)
 ):
-  http_client = httpx.AsyncClient()
-  result = redis.get('dogs_api_all')
+  result = await redis.get('dogs_api_all')
 
   if not result:
-    response = await http_client.get('https://dog.ceo/api/breeds/list/all')
+    async with httpx.AsyncClient() as http_client:
+      response = await http_client.get('https://dog.ceo/api/breeds/list/all')
     result = response.json()
 
     json_data = json.dumps(result)
-    redis.set('dogs_api_all', json_data)
+    await redis.set('dogs_api_all', json_data)
     
     return ResponseHandler.fetch_successful('successfully retrieved dogs data!', result)
 
@@ -107,6 +147,8 @@ app.include_router(users.router, prefix=f'/admin/users', tags=['Admin / Users'],
 app.include_router(patients_admin.router, prefix=f'/admin/users/patients', tags=['Admin / Patients'], dependencies=[Depends(include_admin)])
 app.include_router(doctors_admin.router, prefix=f'/admin/users/doctors', tags=['Admin / Doctors'], dependencies=[Depends(include_admin)])
 app.include_router(hospitals_admin.router, prefix=f'/admin/hospitals', tags=['Admin / Hospitals'], dependencies=[Depends(include_admin)])
+app.include_router(database_admin.router, prefix=f'/admin/database', tags=['Admin / Database'], dependencies=[Depends(include_admin)])
+app.include_router(system_admin.router, prefix=f'/admin/system', tags=['Admin / System'], dependencies=[Depends(include_admin)])
 
 
 
@@ -1,7 +1,7 @@
 
-from sqlalchemy import Column, Integer, Float, JSON, ForeignKey, String, DateTime, func
+from sqlalchemy import Column, Integer, Float, JSON, ForeignKey, String, DateTime, Index, func
 from sqlalchemy.orm import relationship, DeclarativeBase
-from sqlalchemy.dialects.postgresql import UUID, ARRAY
+from sqlalchemy.dialects.postgresql import UUID, ARRAY, JSONB
 from uuid import uuid4
 
 class Base(DeclarativeBase):
@@ -9,23 +9,37 @@ class Base(DeclarativeBase):
 
 class User(Base):
   __tablename__ = "users"
+  __table_args__ = (
+    Index('ix_users_created_at_id', 'created_at', 'id'),
+  )
 
   id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4, unique=True)
   email = Column(String(256), nullable=False, unique=True)
   password = Column(String(256))
-  role = Column(String, nullable=False, default='user')
+  role = Column(String, nullable=False, default='user', index=True)
   name = Column(String)
   gender = Column(String)
   img_src = Column(String)
   address = Column(String)
   created_by = Column(String, nullable=False, default='self_attempted')
+  type = Column(String(20), nullable=False, server_default='user') # subclass discriminator, set by the orm
   created_at = Column(DateTime(timezone=True), server_default=func.now())
   updated_at = Column(DateTime(timezone=True), server_default=func.now())
 
+  __mapper_args__ = {
+    "polymorphic_on": type,
+    "polymorphic_identity": "user",
+  }
+
 
 
 class Hospital(Base):
   __tablename__ = "hospitals"
+  __table_args__ = (
+    Index('ix_hospitals_created_at_id', 'created_at', 'id'),
+    Index('ix_hospitals_emails', 'emails', postgresql_using='gin', postgresql_ops={'emails': 'jsonb_path_ops'}),
+    Index('ix_hospitals_contact_numbers', 'contact_numbers', postgresql_using='gin', postgresql_ops={'contact_numbers': 'jsonb_path_ops'}),
+  )
   
   id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4, unique=True)
   name = Column(String, nullable=False)
@@ -33,8 +47,8 @@ class Hospital(Base):
   city = Column(String, nullable=False)
   img_src = Column(String, nullable=False)
   description = Column(String, nullable=False)
-  emails = Column(JSON, nullable=False)
-  contact_numbers = Column(JSON, nullable=False)
+  emails = Column(JSONB, nullable=False)
+  contact_numbers = Column(JSONB, nullable=False)
   geometry = Column(JSON, nullable=False)
   created_at = Column(DateTime(timezone=True), server_default=func.now())
   updated_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -45,17 +59,25 @@ class Hospital(Base):
 
 class Doctor(User):
   __tablename__ = "doctors"
+  __table_args__ = (
+    Index('ix_doctors_emails', 'emails', postgresql_using='gin', postgresql_ops={'emails': 'jsonb_path_ops'}),
+    Index('ix_doctors_contact_numbers', 'contact_numbers', postgresql_using='gin', postgresql_ops={'contact_numbers': 'jsonb_path_ops'}),
+  )
   
   id = Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete="CASCADE"), primary_key=True)
   description = Column(String, nullable=False)
-  hospital_id = Column(UUID(as_uuid=True), ForeignKey('hospitals.id', ondelete="CASCADE"), nullable=False)
+  hospital_id = Column(UUID(as_uuid=True), ForeignKey('hospitals.id', ondelete="CASCADE"), nullable=False, index=True)
   available_times = Column(String, nullable=False)
   experience = Column(Integer, nullable=False)
-  emails = Column(JSON, nullable=False)
-  contact_numbers = Column(JSON, nullable=False)
+  emails = Column(JSONB, nullable=False)
+  contact_numbers = Column(JSONB, nullable=False)
   
   hospital = relationship("Hospital", back_populates="doctors")
 
+  __mapper_args__ = {
+    "polymorphic_identity": "doctor",
+  }
+
 
 
 class Patient(User):
@@ -66,23 +88,32 @@ class Patient(User):
   contact_number = Column(String)
   emergency_number = Column(String)
   
-  health_records = relationship("HealthRecord", back_populates="patient")
+  # rows of a deleted patient go w the on delete cascade of the database, the orm never nulls patient_id
+  health_records = relationship("HealthRecord", back_populates="patient", cascade="all, delete-orphan", passive_deletes=True)
+  blood_glucose_readings = relationship("BloodGlucoseReading", back_populates="patient", passive_deletes=True)
+
+  __mapper_args__ = {
+    "polymorphic_identity": "patient",
+  }
 
 
 
 class HealthRecord(Base):
   __tablename__ = "health_records"
+  __table_args__ = (
+    Index('ix_health_records_created_at_id', 'created_at', 'id'),
+    Index('ix_health_records_previous_diabetes_records', 'previous_diabetes_records', postgresql_using='gin', postgresql_ops={'previous_diabetes_records': 'jsonb_path_ops'}),
+  )
   
   id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4, unique=True)
-  patient_id = Column(UUID(as_uuid=True), ForeignKey('patients.id', ondelete="CASCADE"), nullable=False)
+  patient_id = Column(UUID(as_uuid=True), ForeignKey('patients.id', ondelete="CASCADE"), nullable=False, index=True)
   weight = Column(Float)
   height = Column(Float)
   blood_group = Column(String)
   smoking_status = Column(String)
   physical_activity = Column(String)
-  previous_diabetes_records = Column(JSON)
+  previous_diabetes_records = Column(JSONB)
   blood_pressure_records = Column(JSON)
-  blood_glucose_records = Column(JSON)
   body_temperature = Column(Float)
   blood_oxygen = Column(String)
   bmi = Column(Float)
@@ -92,3 +123,18 @@ class HealthRecord(Base):
   patient = relationship("Patient", back_populates="health_records")
 
 
+
+# append only time series, one row per reading
+class BloodGlucoseReading(Base):
+  __tablename__ = "blood_glucose_readings"
+  __table_args__ = (
+    Index('ix_blood_glucose_readings_patient_id_measured_at', 'patient_id', 'measured_at'),
+  )
+
+  id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+  patient_id = Column(UUID(as_uuid=True), ForeignKey('patients.id', ondelete="CASCADE"), nullable=False)
+  measured_at = Column(DateTime(timezone=True), nullable=False)
+  value = Column(Integer, nullable=False)
+  created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+  patient = relationship("Patient", back_populates="blood_glucose_readings")
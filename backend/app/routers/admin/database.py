@@ -0,0 +1,17 @@
+from fastapi import APIRouter
+
+from app.db import engine, replica_engine
+from app.core.utils import ResponseHandler
+
+
+
+router = APIRouter()
+
+
+# get the connection pool statistics of this worker /admin
+@router.get('/pool')
+async def get_pool_statistics():
+  return ResponseHandler.fetch_successful('successfully fetched connection pool statistics!', {
+    "primary": engine.pool.snapshot(),
+    "replica": replica_engine.pool.snapshot() if replica_engine else None,
+  })
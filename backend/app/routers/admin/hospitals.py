@@ -1,8 +1,8 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
-from app.db import get_db as db 
+from app.db import get_db as db, get_read_db as read_db
 from app.schemas.hospital import HospitalCreateAdmin, HospitalUpdateAdmin
 from app.core.utils import ResponseHandler
 from app.services.hospital import HospitalService
@@ -17,35 +17,36 @@ router = APIRouter()
 async def get_all_patients(
   offset: int = None, 
   limit: int = None, 
-  db: Session = Depends(db)
+  cursor: str = None, 
+  db: AsyncSession = Depends(read_db)
 ):
-  return await HospitalService.retrieve_all_hospitals_admin(db, offset, limit)
+  return await HospitalService.retrieve_all_hospitals_admin(db, offset, limit, cursor)
 
 
 
 # create a new hospital account /admin 
 @router.post('/new', status_code=201)
-async def create_new_hospital(details: HospitalCreateAdmin, db: Session = Depends(db)):
+async def create_new_hospital(details: HospitalCreateAdmin, db: AsyncSession = Depends(db)):
   return await HospitalService.create_hospital_account_admin(details, db)
 
 
 
 @router.get('/profile')
-async def get_hospital_informations(id: str, db: Session = Depends(db)
+async def get_hospital_informations(id: str, db: AsyncSession = Depends(read_db)
 ):
   return await HospitalService.get_hospital_information_admin(id, db)
 
 
 
 @router.put('/profile')
-async def update_hospital_informations(id: str, details: HospitalUpdateAdmin, db: Session = Depends(db)):
+async def update_hospital_informations(id: str, details: HospitalUpdateAdmin, db: AsyncSession = Depends(db)):
   return await HospitalService.update_hospital_information_admin(id, details, db)
 
 
 
 # delete patient health record using a single record id or multiple record ids  
 @router.delete('/profile')
-async def delete_hospital(id: str | None = None, ids: List[str] | None = None, db: Session = Depends(db)):
+async def delete_hospital(id: str | None = None, ids: List[str] | None = None, db: AsyncSession = Depends(db)):
   if id and ids:
     raise ResponseHandler.no_permission('choose either single or batch delete option!')
 
@@ -1,12 +1,13 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
-from app.db import get_db as db 
+from app.db import get_db as db, get_read_db as read_db
 from app.schemas.users import PatientCreateAdmin, PatientUpdateAdmin
 from app.schemas.health import HealthRecordUpdateAdmin
 from app.services.patient import PatientService
 from app.services.health import HealthMonitorings
+from app.services.ingest import HealthRecordIngestion, PatientAccountImport
 from app.core.utils import ResponseHandler
 
 
@@ -19,27 +20,51 @@ router = APIRouter()
 async def get_all_patients(
   offset: int = None, 
   limit: int = None, 
-  db: Session = Depends(db)
+  cursor: str = None, 
+  db: AsyncSession = Depends(read_db)
 ):
-  return await PatientService.retrieve_all_patients_admin(db, offset, limit)
+  return await PatientService.retrieve_all_patients_admin(db, offset, limit, cursor)
+
+
+
+# find patients by an entry of their diabetes history
+@router.get('/lookup')
+async def lookup_patients(
+  diabetes_record: str,
+  offset: int = None, 
+  limit: int = None, 
+  cursor: str = None, 
+  db: AsyncSession = Depends(read_db)
+):
+  return await PatientService.find_patients_by_diabetes_record(diabetes_record, db, offset, limit, cursor)
 
 
 
 @router.post('/new', status_code=201)
-async def create_new_patient_account(patient_data: PatientCreateAdmin, db: Session = Depends(db)):
+async def create_new_patient_account(patient_data: PatientCreateAdmin, db: AsyncSession = Depends(db)):
   return await PatientService.create_patient_account_admin(patient_data, db)
 
 
 
+# bulk import patient accounts streamed as csv (w a header row) or ndjson, the insert runs as a celery task
+@router.post('/bulk', status_code=202)
+async def bulk_import_patient_accounts(request: Request, db: AsyncSession = Depends(db)):
+  content_type = request.headers.get('content-type', '')
+  format = 'ndjson' if 'ndjson' in content_type or 'jsonl' in content_type else 'csv'
+
+  return await PatientAccountImport.import_patient_accounts_admin(request.stream(), format, db)
+
+
+
 @router.get('/profile')
-async def get_patient_account_informations(id: str, db: Session = Depends(db)
+async def get_patient_account_informations(id: str, db: AsyncSession = Depends(read_db)
 ):
   return await PatientService.get_patient_information_admin(id, db) 
 
 
 
 @router.put('/profile')
-async def update_patient_account_informations(id: str, details: PatientUpdateAdmin, db: Session = Depends(db)):
+async def update_patient_account_informations(id: str, details: PatientUpdateAdmin, db: AsyncSession = Depends(db)):
   return await PatientService.update_patient_information_admin(id, details, db) 
 
 
@@ -49,35 +74,45 @@ async def update_patient_account_informations(id: str, details: PatientUpdateAdm
 async def get_all_patient_health_record_details(
   offset: int = None, 
   limit: int = None, 
-  db: Session = Depends(db)
+  cursor: str = None, 
+  db: AsyncSession = Depends(read_db)
 ):
-  return await HealthMonitorings.retrieve_all_health_records_admin(db, offset, limit)
+  return await HealthMonitorings.retrieve_all_health_records_admin(db, offset, limit, cursor)
 
 
 
 # create new health record using patient id 
 @router.post('/health/records/new')
-async def create_patient_health_records(id: str, details: HealthRecordUpdateAdmin, db: Session = Depends(db)):
+async def create_patient_health_records(id: str, details: HealthRecordUpdateAdmin, db: AsyncSession = Depends(db)):
   return await HealthMonitorings.create_patient_health_record_admin(id, details, db)
 
 
+# bulk ingest health records streamed as csv (w a header row) or ndjson, one record per line
+@router.post('/health/records/bulk')
+async def bulk_ingest_patient_health_records(request: Request, db: AsyncSession = Depends(db)):
+  content_type = request.headers.get('content-type', '')
+  format = 'ndjson' if 'ndjson' in content_type or 'jsonl' in content_type else 'csv'
+
+  return await HealthRecordIngestion.ingest_health_records_admin(request.stream(), format, db)
+
+
 # get patient health record details using patient id 
 @router.get('/health/records')
-async def get_patient_health_record_details(id: str, db: Session = Depends(db)):
+async def get_patient_health_record_details(id: str, db: AsyncSession = Depends(read_db)):
   return await HealthMonitorings.get_patient_health_record_admin(id, db)
 
 
 
 # update patient health record details using record id 
 @router.put('/health/records')
-async def update_patient_health_record_details(id: str, details: HealthRecordUpdateAdmin, db: Session = Depends(db)):
+async def update_patient_health_record_details(id: str, details: HealthRecordUpdateAdmin, db: AsyncSession = Depends(db)):
   return await HealthMonitorings.update_patient_health_record_admin(id, details, db)
 
 
 
 # delete patient health record using a single record id or multiple record ids  
 @router.delete('/health/records')
-async def delete_patient_health_record(id: str | None = None, ids: List[str] | None = None, db: Session = Depends(db)):
+async def delete_patient_health_record(id: str | None = None, ids: List[str] | None = None, db: AsyncSession = Depends(db)):
   if id and ids:
     raise ResponseHandler.no_permission('choose either single or batch delete option!')
 
@@ -0,0 +1,38 @@
+from fastapi import APIRouter
+
+from app.core.hashing import hasher
+from app.core.redis import redis_client
+from app.core.cache import caches
+from app.core.invalidation import invalidation_bus
+from app.core.utils import ResponseHandler
+
+
+
+router = APIRouter()
+
+
+# get the password hashing pool statistics of this worker /admin
+@router.get('/hashing')
+async def get_hashing_statistics():
+  return ResponseHandler.fetch_successful('successfully fetched password hashing statistics!', hasher.snapshot())
+
+
+
+# get the redis connection pool statistics of this worker /admin
+@router.get('/redis')
+async def get_redis_statistics():
+  return ResponseHandler.fetch_successful('successfully fetched redis connection pool statistics!', redis_client.snapshot())
+
+
+
+# get the hit n miss counters of every response cache of this worker /admin
+@router.get('/cache')
+async def get_cache_statistics():
+  return ResponseHandler.fetch_successful('successfully fetched cache statistics!', { namespace: cache.snapshot() for namespace, cache in caches.items() })
+
+
+
+# get the cache invalidation bus statistics of this worker /admin
+@router.get('/invalidations')
+async def get_invalidation_statistics():
+  return ResponseHandler.fetch_successful('successfully fetched cache invalidation statistics!', invalidation_bus.snapshot())
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import JSONResponse, RedirectResponse
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import requests
 import json
 
@@ -9,7 +9,8 @@ from app.schemas.users import UserCredentials
 from app.db import get_db as db
 from app.core.security import get_user_token
 from app.services.auth import AuthService
-from app.core.dependecies import include_auth
+from app.core.dependecies import include_auth, oauth2_scheme
+from fastapi.security import HTTPAuthorizationCredentials
 from app.models import User
 from app.core.utils import ResponseHandler, Custom
 from app.core.config import settings
@@ -20,16 +21,22 @@ router = APIRouter()
 
 # user signup endpoint
 @router.post('/signup')
-async def user_signup(credentials: UserCredentials, db: Session = Depends(db)):
+async def user_signup(credentials: UserCredentials, db: AsyncSession = Depends(db)):
   return await AuthService.signup(credentials, db)
 
 
 # user login endpoint
 @router.post('/login')
-async def user_login(credentials: UserCredentials, db: Session = Depends(db)):
+async def user_login(credentials: UserCredentials, db: AsyncSession = Depends(db)):
   return await AuthService.login(credentials, db)
 
 
+# user logout endpoint, revokes both tokens of the login
+@router.post('/logout')
+async def user_logout(credentials: HTTPAuthorizationCredentials = Depends(oauth2_scheme)):
+  return await AuthService.logout(credentials.credentials)
+
+
 # generate new user token using refresh token
 @router.get("/token/refresh")
 async def read_items(
@@ -61,7 +68,7 @@ async def user_google_auth(state: str):
 
 # handle google callback
 @router.get('/google/callback')
-async def user_google_callback(state, code: str | None = None, error: str | None = None, db: Session = Depends(db)):
+async def user_google_callback(state, code: str | None = None, error: str | None = None, db: AsyncSession = Depends(db)):
   token_url = "https://accounts.google.com/o/oauth2/token"
   payload = {
     "code": code,
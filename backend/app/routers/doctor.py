@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from uuid import UUID
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.services.doctor import DoctorService
-from app.db import get_db as db
+from app.db import get_read_db as read_db
+from app.core.conditional import conditional_response
 
 router = APIRouter()
 
@@ -10,28 +12,42 @@ router = APIRouter()
 # retrieve all the doctor accounts for general users 
 @router.get('/all')
 async def retrieve_all_doctor_informations(
+  request: Request,
   offset: int = None, 
   limit: int = None, 
-  db: Session = Depends(db)
+  cursor: str = None, 
+  db: AsyncSession = Depends(read_db)
 ):
-  return await DoctorService.retrieve_all_doctors_general(db, offset, limit)
+  # the etag of a cached page is known w/o querying, a client holding it gets a 304
+  entry = await DoctorService.retrieve_all_doctors_general.entry(db, offset, limit, cursor)
+  return conditional_response(request, entry['value'], entry['etag'], shared=True)
 
 
 
 
 # retrieve doctor account information using doctor id for general users 
 @router.get('/profile')
-async def get_doctor_information(id: str, db: Session = Depends(db)):
-  return await DoctorService.get_doctor_information(id, db)
+async def get_doctor_information(request: Request, id: str, db: AsyncSession = Depends(read_db)):
+  return conditional_response(request, await DoctorService.get_doctor_information(id, db), shared=True)
+
+
+
+# look up doctors by one of their emails or contact numbers for general users
+@router.get('/lookup')
+async def lookup_doctors(request: Request, email: str = None, contact_number: str = None, db: AsyncSession = Depends(read_db)):
+  return conditional_response(request, await DoctorService.find_doctors_by_contact(email, contact_number, db))
 
 
 
 # retrive all doctors informations of a specific hospital for general users
 @router.get('/{hospital_id}/all')
 async def get_all_doctor_of_hospital(
-  hospital_id: str,
+  request: Request,
+  hospital_id: UUID,
   offset: int = None, 
   limit: int = None, 
-  db: Session = Depends(db)
+  cursor: str = None, 
+  db: AsyncSession = Depends(read_db)
 ):
-  return await DoctorService.retrieve_doctors_by_hospital_general(hospital_id, db, offset, limit)
+  entry = await DoctorService.retrieve_doctors_by_hospital_general.entry(hospital_id, db, offset, limit, cursor)
+  return conditional_response(request, entry['value'], entry['etag'], shared=True)
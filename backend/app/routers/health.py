@@ -1,8 +1,10 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from typing import Literal
+from datetime import datetime
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models import Patient
-from app.db import get_db as db
+from app.db import get_db as db, get_read_db as read_db
 from app.core.dependecies import include_auth
 from app.services.health import HealthMonitorings, HealthRecordUpdate, BloodPressure, BloodGlucose
 
@@ -16,7 +18,7 @@ router = APIRouter()
 async def get_patient_health_records(
   id: str, 
   session_user: Patient = Depends(include_auth),
-  db: Session = Depends(db)
+  db: AsyncSession = Depends(read_db)
 ):
   return await HealthMonitorings.get_health_record_details(id, session_user, db)
 
@@ -27,7 +29,7 @@ async def create_patient_health_records(
   health_records: HealthRecordUpdate, 
   id: str, 
   session_user: Patient = Depends(include_auth),
-  db: Session = Depends(db)
+  db: AsyncSession = Depends(db)
 ):
   return await HealthMonitorings.create_health_record_details(health_records, id, session_user, db)
 
@@ -37,7 +39,7 @@ async def create_patient_health_records(
 async def update_patient_health_records(
   updated_data: HealthRecordUpdate, 
   id: str,
-  db: Session = Depends(db), 
+  db: AsyncSession = Depends(db), 
   session_user: Patient = Depends(include_auth)
 ):
   return await HealthMonitorings.update_health_record_by_id(updated_data, id, session_user, db)
@@ -50,17 +52,41 @@ async def update_patient_blood_pressure_records(
   updated_data: BloodPressure,
   id: str,
   session_user: Patient = Depends(include_auth),
-  db: Session = Depends(db)
+  db: AsyncSession = Depends(db)
 ):
   return await HealthMonitorings.update_blood_pressure_by_id(updated_data, id, session_user, db)
 
 
+# get downsampled blood glucose readings of a time range using patient id 
+@router.get('/records/glucose')
+async def get_patient_blood_glucose_summary(
+  id: str,
+  start: datetime | None = None,
+  end: datetime | None = None,
+  bucket: Literal['hour', 'day', 'week'] = 'day',
+  session_user: Patient = Depends(include_auth),
+  db: AsyncSession = Depends(read_db)
+):
+  return await HealthMonitorings.get_blood_glucose_summary(id, start, end, bucket, session_user, db)
+
+
+# append new blood glucose readings using patient id 
+@router.post('/records/glucose', status_code=201)
+async def append_patient_blood_glucose_readings(
+  new_readings: BloodGlucose,
+  id: str,
+  session_user: Patient = Depends(include_auth),
+  db: AsyncSession = Depends(db)
+):
+  return await HealthMonitorings.append_blood_glucose_readings(new_readings, id, session_user, db)
+
+
 @router.put('/records/glucose')
 async def update_patient_blood_glucose_records(
   updated_data: BloodGlucose,
   id: str,
   session_user: Patient = Depends(include_auth),
-  db: Session = Depends(db)
+  db: AsyncSession = Depends(db)
 ):
   return await HealthMonitorings.update_blood_glucose_by_id(updated_data, id, session_user, db) 
 
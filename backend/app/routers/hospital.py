@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db import get_db as db
+from app.db import get_read_db as read_db
 from app.services.hospital import HospitalService
+from app.core.conditional import conditional_response
 
 
 router = APIRouter()
@@ -11,15 +12,27 @@ router = APIRouter()
 # retrieve all the hospital details 
 @router.get('/all')
 async def get_all_hospitals(
+  request: Request,
   offset: int = None, 
   limit: int = None, 
-  db: Session = Depends(db)
+  cursor: str = None, 
+  db: AsyncSession = Depends(read_db)
 ):
-  return await HospitalService.retrieve_all_hospitals(db, offset, limit)
+  # the etag of a cached page is known w/o querying, a client holding it gets a 304
+  entry = await HospitalService.retrieve_all_hospitals.entry(db, offset, limit, cursor)
+  return conditional_response(request, entry['value'], entry['etag'], shared=True)
+
+
+
+# look up hospitals by one of their emails or contact numbers 
+@router.get('/lookup')
+async def lookup_hospitals(email: str = None, contact_number: str = None, db: AsyncSession = Depends(read_db)):
+  return await HospitalService.find_hospitals_by_contact(email, contact_number, db)
 
 
 
 # retrieve hospital details using hospital id 
 @router.get('/profile')
-async def get_hospital_information(id: str, db: Session = Depends(db)):
-  return await HospitalService.get_hospital_information(id, db)
\ No newline at end of file
+async def get_hospital_information(request: Request, id: str, db: AsyncSession = Depends(read_db)):
+  entry = await HospitalService.get_hospital_information.entry(id, db)
+  return conditional_response(request, entry['value'], entry['etag'], shared=True)
\ No newline at end of file
@@ -1,5 +1,5 @@
 from fastapi import HTTPException, APIRouter, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models import Patient
 from app.db import get_db as db
@@ -24,7 +24,7 @@ async def get_patient_account_information(id: str, session_user: Patient = Depen
 async def update_patient_account_information(
   id: str, 
   updated_data: UserUpdate, 
-  db: Session = Depends(db), 
+  db: AsyncSession = Depends(db), 
   session_user: Patient = Depends(include_auth)
 ):
   return await PatientService.change_patient_information(id, updated_data, session_user, db)
@@ -35,11 +35,13 @@ async def update_patient_account_information(
 @router.put("/profile/password")
 async def change_patient_account_password(
   updated_data: UserPasswordChange, 
-  db: Session = Depends(db), 
+  db: AsyncSession = Depends(db), 
   session_user: Patient = Depends(include_auth)
 ):
   try:
     return await PatientService.change_user_password(updated_data, session_user, db)
+  except HTTPException:
+    raise # keeps the status of the service errors, e.g. the 503 n retry-after of a saturated hasher
   except Exception:
     raise HTTPException(status_code=403, detail="you're not allowed to change the password!")
 
@@ -1,4 +1,5 @@
 from typing import List
+from datetime import datetime
 from pydantic import BaseModel
 
 
@@ -16,6 +17,17 @@ class HealthRecordValues(BaseModel):
   value: int
   measurement_time: str
 
+class GlucoseReading(BaseModel):
+  value: int
+  measurement_time: datetime
+
+class GlucoseBucket(BaseModel):
+  bucket_start: datetime
+  min: int
+  max: int
+  mean: float
+  count: int
+
 class BloodPressureBase(BaseModel):
   type: str 
   data: List[HealthRecordValues]
@@ -30,7 +42,7 @@ class HealthRecordResponse(BaseModel):
   physical_activity: str | None = None 
   previous_diabetes_records: List[str] | None = None 
   blood_pressure_records: List[BloodPressureBase] | None = None 
-  blood_glucose_records: List[HealthRecordValues] | None = None 
+  blood_glucose_records: List[GlucoseReading] | None = None 
   body_temperature: float | None = None 
   blood_oxygen: str | None = None 
   bmi: float | None = None 
@@ -52,7 +64,7 @@ class BloodPressure(HealthRecordBase):
 
 
 class BloodGlucose(HealthRecordBase):
-  blood_glucose_records: List[HealthRecordValues]
+  blood_glucose_records: List[GlucoseReading]
 
 
 # admin 
@@ -66,4 +78,4 @@ class HealthRecordUpdateAdmin(HealthRecordBase):
   body_temperature: float = None
   blood_oxygen: str = None
   blood_pressure_records: List[BloodPressureBase] = None 
-  blood_glucose_records: List[HealthRecordValues] = None 
+  blood_glucose_records: List[GlucoseReading] = None 
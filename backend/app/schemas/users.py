@@ -12,6 +12,13 @@ class UserBase(BaseModel):
   pass
 
 
+# identity signed into the access token, enough to authorize w/o a database lookup
+class TokenClaims(BaseModel):
+  id: str
+  role: str
+  type: str
+
+
 class UserCredentials(UserBase):
   email: EmailStr
   password: str
@@ -1,17 +1,21 @@
 from fastapi import status, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models import User, Patient
 from app.core.utils import ResponseHandler
 from app.schemas.users import UserCredentials, UserLoginGoogle
-from app.core.security import decrypt, generate_hash, verify_password, get_user_token
+from app.core.security import decrypt, get_user_token, decode_token, needs_rehash
+from app.core.revocation import revocations
+from app.core.hashing import hasher
 
 
 
 class AuthService:
   @staticmethod
-  async def signup(credentials: UserCredentials, db: Session):
-    exits = db.query(User).where(User.email == credentials.email).first()
+  async def signup(credentials: UserCredentials, db: AsyncSession):
+    result = await db.execute(select(User).where(User.email == credentials.email))
+    exits = result.scalars().first()
     
     # check if the user exists
     if exits:
@@ -21,15 +25,15 @@ class AuthService:
     decrypted_password = await decrypt(credentials.password)
 
     # generate hashed password
-    hashed_password = generate_hash(decrypted_password)
+    hashed_password = await hasher.hash(decrypted_password)
     credentials.password = hashed_password
 
     # create a patient w the hashed password
     new_patient = Patient(**credentials.model_dump())
     db.add(new_patient)
-    db.commit()
+    await db.commit()
     
-    db.refresh(new_patient)
+    await db.refresh(new_patient)
 
     # return user details w token
     return await get_user_token(new_patient, f'patient-{new_patient.id} has been created successfully!', status.HTTP_201_CREATED)
@@ -38,8 +42,9 @@ class AuthService:
 
   # handle built in login 
   @staticmethod
-  async def login(credentials: UserCredentials, db: Session):
-    user = db.query(User).filter(User.email == credentials.email).first()
+  async def login(credentials: UserCredentials, db: AsyncSession):
+    result = await db.execute(select(User).filter(User.email == credentials.email))
+    user = result.scalars().first()
     
     # check if the user exists
     if not user:
@@ -49,18 +54,57 @@ class AuthService:
     decrypted_password = await decrypt(credentials.password)
     
     # verify password 
-    if not verify_password(decrypted_password, user.password):
+    if not await hasher.verify(decrypted_password, user.password):
       raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='password is incorrect')
     
+    # upgrade (or downgrade) the stored hash to the configured cost while the plain password is at hand
+    if needs_rehash(user.password):
+      await AuthService.rehash_password(user, decrypted_password, db)
 
     # return user details w token
     return await get_user_token(user, f'{user.id} - login successful!', status.HTTP_200_OK)
   
 
 
+  # replace the stored hash of a user, skipped if the password changed meanwhile or the hashing pool is busy
+  @staticmethod
+  async def rehash_password(user: User, plain_password: str, db: AsyncSession):
+    try:
+      hashed_password = await hasher.hash(plain_password)
+    except HTTPException:
+      return # the next login tries again
+
+    await db.execute(
+      update(User.__table__)
+      .where(User.__table__.c.id == user.id, User.__table__.c.password == user.password)
+      .values(password=hashed_password)
+    )
+    await db.commit()
+
+
+
+  # revoke the tokens of the current login
+  @staticmethod
+  async def logout(token: str):
+    payload = decode_token(token)
+
+    # tokens issued w/o a jti can only be revoked together w every other token of the user
+    if not payload.get('jti'):
+      await revocations.revoke_subjects([payload.get('sub')])
+    else:
+      # the refresh token shares the jti, so the access token n it are revoked together
+      await revocations.revoke_token(payload['jti'])
+
+    return {
+      "status": "successful",
+      "message": f"successfully logged out - {payload.get('sub')}"
+    }
+
+
+
   # handle google authetication (patient)
   @staticmethod
-  async def google_auth(credentials: UserLoginGoogle, tag: str | None, db: Session):
+  async def google_auth(credentials: UserLoginGoogle, tag: str | None, db: AsyncSession):
     email = credentials.get('email')
     name = credentials.get('name')
     img_src = credentials.get('picture')
@@ -72,7 +116,8 @@ class AuthService:
       )
     
     # get the user using the payload email 
-    user = db.query(User).where(User.email == email).first()
+    result = await db.execute(select(User).where(User.email == email))
+    user = result.scalars().first()
 
     # handle user login
     # verify if the user exists 
@@ -98,8 +143,8 @@ class AuthService:
     )
 
     db.add(new_patient)
-    db.commit()
-    db.refresh(new_patient)
+    await db.commit()
+    await db.refresh(new_patient)
 
     # return the tokens for the newly created user
     return await get_user_token(new_patient, f'patient-{new_patient.id} has been created successfully!', 201)
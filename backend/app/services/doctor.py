@@ -1,25 +1,49 @@
+from uuid import UUID
 from fastapi import Depends, HTTPException, Query
-from sqlalchemy.orm import Session, joinedload, defer
-from sqlalchemy import func
+from sqlalchemy.orm import joinedload, defer
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import JSON, func, select, update, or_
 
 from app.db import get_db as db 
-from app.core.security import decrypt, generate_hash
+from app.core.security import decrypt
 from app.models import User, Doctor, Hospital
 from app.schemas.doctor import DoctorCreateAdmin, DoctorUpdateAdmin, DoctorResponse
 from app.core.utils import ResponseHandler
 from app.core.security import uuid_to_short_url, short_url_to_uuid
+from app.core.pagination import paginate, next_cursor
+from app.core.updates import update_returning
+from app.core.hashing import hasher
+from app.core.principals import principals
+from app.core.cache import ResponseCache, NegativeCache, cached
+from app.core.config import settings
+
+
+# public doctor listings, pages are tagged w the doctors n hospitals they show
+doctor_cache = ResponseCache('doctors', stale_ttl=settings.cache_stale_ttl)
+missing_doctors = NegativeCache('doctors')
+
+
+
+# tags of a listing page, the doctors on it n their hospitals
+def page_tags(response: dict):
+  for doctor in response['data']:
+    yield f"doctor:{short_url_to_uuid(doctor['url'])}"
+    yield f"hospital:{doctor['hospital_id']}"
+
 
 
 class DoctorService:
   # create a new doctor account /admin
   @staticmethod
-  async def new_doctor_account_admin(details: DoctorCreateAdmin, hospital_id: str, db: Session = Depends(db)):
-    hospital = db.query(Hospital).where(Hospital.id == hospital_id).first()
+  async def new_doctor_account_admin(details: DoctorCreateAdmin, hospital_id: str, db: AsyncSession = Depends(db)):
+    result = await db.execute(select(Hospital).where(Hospital.id == hospital_id))
+    hospital = result.scalars().first()
 
     if not hospital:
       raise ResponseHandler.not_found_error(f'hospital not found - {hospital_id}')
     
-    exits = db.query(Doctor).where(Doctor.email == details.email).first()
+    result = await db.execute(select(Doctor).where(Doctor.email == details.email))
+    exits = result.scalars().first()
     
     # check if the doctor account already exists
     if exits:
@@ -32,7 +56,7 @@ class DoctorService:
     decrypted_password = await decrypt(details.password) # decrypt the password from the client
     
     # generate hashed password
-    hashed_password = generate_hash(decrypted_password)
+    hashed_password = await hasher.hash(decrypted_password)
     details.password = hashed_password
 
     details.emails = [details.email, *hospital.emails]
@@ -49,8 +73,12 @@ class DoctorService:
     new_doctor = Doctor(**payload)
     
     db.add(new_doctor)
-    db.commit()
-    db.refresh(new_doctor)
+    await db.commit()
+    await db.refresh(new_doctor)
+
+    # the new doctor shows up in the full listing n the listing of its hospital
+    await doctor_cache.invalidate(tags=['list', f'hospital:{hospital.id}'])
+    await missing_doctors.discard([new_doctor.id])
 
     return {
       "status": "successful",
@@ -62,42 +90,50 @@ class DoctorService:
   # retrieve all doctor accounts  /admin
   @staticmethod
   async def retrieve_all_doctors_admin(
-    db: Session,
+    db: AsyncSession,
     offset: int = 0, 
     # this way it adds a layer of constraint, asking the parameter either be 100 or less than 100
     limit: int = Query(default=100, le=100),
+    cursor: str = None,
   ):
-    doctors = db.query(Doctor).offset(offset).limit(limit).options(
+    query = select(Doctor).options(
       defer(Doctor.password),
       joinedload(Doctor.hospital).load_only(Hospital.id, Hospital.name, Hospital.city, Hospital.address)
-    ).all()
+    )
+    result = await db.execute(paginate(query, Doctor, offset, limit, cursor))
+    doctors = result.scalars().all()
     
     return {
       "status": "successful",
       "message": "successfully fetched all doctors!",
       "data": doctors,
+      "next_cursor": next_cursor(doctors, limit, offset, cursor),
     } 
   
 
   # retrieve all doctor accounts  /general
   @staticmethod
+  @cached(doctor_cache, 'all:{offset}:{limit}:{cursor}', tags=lambda response, **_: ['list', *page_tags(response)])
   async def retrieve_all_doctors_general(
-    db: Session,
+    db: AsyncSession,
     offset: int = 0, 
     limit: int = Query(default=100, le=100),
+    cursor: str = None,
   ):
-    doctors = db.query(Doctor).offset(offset).limit(limit).options(
+    # created_at is loaded for the cursor but kept out of the general response
+    query = select(Doctor).options(
       defer(Doctor.password),
-      defer(Doctor.created_at),
       defer(Doctor.updated_at),
       joinedload(Doctor.hospital).load_only(Hospital.id, Hospital.name, Hospital.city, Hospital.address)
-    ).all()
+    )
+    result = await db.execute(paginate(query, Doctor, offset, limit, cursor))
+    doctors = result.scalars().all()
 
     # transform the result for general users 
     result = [
       {
         "url": uuid_to_short_url(str(doctor.id)),
-        **{key: val for key, val in doctor.__dict__.items() if key != 'id' }
+        **{key: val for key, val in doctor.__dict__.items() if key not in ('id', 'created_at') }
       }
       for doctor in doctors
     ]
@@ -107,22 +143,29 @@ class DoctorService:
       "status": "successful",
       "message": "successfully fetched all doctors!",
       "data": result,
+      "next_cursor": next_cursor(doctors, limit, offset, cursor),
     } 
   
 
 
   # retrieve doctor account information using doctor id  /general
   @staticmethod
-  async def get_doctor_information(id: str, db: Session):
+  async def get_doctor_information(id: str, db: AsyncSession):
     doctor_id = short_url_to_uuid(id)
+
+    # ids recently found missing are answered w/o a query
+    if missing_doctors.contains(doctor_id):
+      raise ResponseHandler.not_found_error(f'doctor not found - {doctor_id}')
     
-    doctor = db.query(Doctor).where(Doctor.id == doctor_id).options(
+    result = await db.execute(select(Doctor).where(Doctor.id == doctor_id).options(
       defer(Doctor.password),
       joinedload(Doctor.hospital).load_only(Hospital.id, Hospital.name, Hospital.city, Hospital.address)
-    ).first()
+    ))
+    doctor = result.scalars().first()
 
 
     if not doctor:
+      missing_doctors.add(doctor_id)
       raise ResponseHandler.not_found_error(f'doctor not found - {doctor_id}')
     
 
@@ -152,13 +195,55 @@ class DoctorService:
 
 
   
+  # find doctors listing the given email or contact number /general
+  @staticmethod
+  async def find_doctors_by_contact(email: str | None, contact_number: str | None, db: AsyncSession):
+    if not email and not contact_number:
+      raise HTTPException(
+        status_code=400,
+        detail='looking up doctors failed, provide an email or a contact number!'
+      )
+
+    # containment (@>) lookups are served by the gin indexes instead of scanning every row
+    conditions = []
+    if email:
+      conditions.append(Doctor.emails.contains([email]))
+    if contact_number:
+      conditions.append(Doctor.contact_numbers.contains([contact_number]))
+
+    result = await db.execute(select(Doctor).where(or_(*conditions)).options(
+      defer(Doctor.password),
+      defer(Doctor.created_at),
+      defer(Doctor.updated_at),
+      joinedload(Doctor.hospital).load_only(Hospital.id, Hospital.name, Hospital.city, Hospital.address)
+    ))
+    doctors = result.scalars().all()
+
+    # transform the result for general users 
+    result = [
+      {
+        "url": uuid_to_short_url(str(doctor.id)),
+        **{key: val for key, val in doctor.__dict__.items() if key != 'id' }
+      }
+      for doctor in doctors
+    ]
+
+    return {
+      "status": "successful",
+      "message": f"successfully found {len(result)} doctors!",
+      "data": result,
+    }
+
+
+
   # get doctor information using doctor id /admin
   @staticmethod
-  async def get_doctor_information_admin(doctor_id: str, db: Session):
-    doctor = db.query(Doctor).where(Doctor.id == doctor_id).options(
+  async def get_doctor_information_admin(doctor_id: str, db: AsyncSession):
+    result = await db.execute(select(Doctor).where(Doctor.id == doctor_id).options(
       defer(Doctor.password),
       joinedload(Doctor.hospital).load_only(Hospital.id, Hospital.name, Hospital.city, Hospital.address)
-    ).first()
+    ))
+    doctor = result.scalars().first()
 
     if not doctor:
       raise ResponseHandler.not_found_error(f'doctor not found - {doctor_id}')
@@ -174,52 +259,42 @@ class DoctorService:
 
   # update doctor information using doctor id /admin
   @staticmethod 
-  async def update_doctor_information_admin(doctor_id: str, details: DoctorUpdateAdmin, db: Session):
-    doctor = db.query(Doctor).where(Doctor.id == doctor_id).first()
-
-    # check if the doctor exists
-    if not doctor:
-      raise ResponseHandler.not_found_error(f'doctor not found - {doctor_id}')
-
+  async def update_doctor_information_admin(doctor_id: str, details: DoctorUpdateAdmin, db: AsyncSession):
     if(details.is_empty()):
       raise HTTPException(
         status_code=400,
-        detail=f"updating doctor failed, no field was provided - {doctor.id}"
+        detail=f"updating doctor failed, no field was provided - {doctor_id}"
       )
 
     # check if the password is given or not
     if details.password:
       decrypted_new_pass = await decrypt(details.password)
-      new_hashed_pass = generate_hash(decrypted_new_pass)
+      new_hashed_pass = await hasher.hash(decrypted_new_pass)
       details.password = new_hashed_pass
 
 
-    # update the patient information
-    payload = { "updated_at": func.now(), **details.none_excluded() }
-    user_payload = { key: val for key, val in payload.items() if key in User.__table__.columns }
-    doctor_payload = { key: val for key, val in payload.items() if key in Doctor.__table__.columns }
-
+    # the hospital summary is returned by the doctors statement instead of a joinedload re-query
+    hospital = select(
+      func.json_build_object('id', Hospital.id, 'name', Hospital.name, 'city', Hospital.city, 'address', Hospital.address, type_=JSON)
+    ).where(Hospital.id == Doctor.__table__.c.hospital_id).scalar_subquery().label('hospital')
 
-    if user_payload:
-      db.query(User).where(User.id == doctor.id).update(user_payload)
-    
-    if doctor_payload:
-      db.query(Doctor).where(Doctor.id == doctor.id).update(doctor_payload)
-    
+    # update the users n doctors rows, each statement returns its columns
+    payload = { "updated_at": func.now(), **details.none_excluded() }
+    doctor = await update_returning(Doctor, doctor_id, payload, db, returning=[hospital])
 
-    db.commit()
-    db.refresh(doctor)
+    # check if the doctor exists
+    if not doctor:
+      raise ResponseHandler.not_found_error(f'doctor not found - {doctor_id}')
 
-    doctor_informations = db.query(Doctor).where(Doctor.id == doctor_id).options(
-      defer(Doctor.password),
-      joinedload(Doctor.hospital).load_only(Hospital.id, Hospital.name, Hospital.city, Hospital.address)
-    ).first()
+    await db.commit()
+    await principals.invalidate([doctor['id']])
+    await doctor_cache.invalidate(tags=[f"doctor:{doctor['id']}"])
 
 
     return {
       "status": "successful",
-      "message": f"successfully updated doctor information - {doctor.id}",
-      "data": doctor_informations
+      "message": f"successfully updated doctor information - {doctor['id']}",
+      "data": doctor
     }
 
 
@@ -228,19 +303,23 @@ class DoctorService:
   @staticmethod
   async def retrieve_doctors_by_hospital_admin(
     hospital_id: str, 
-    db: Session,
+    db: AsyncSession,
     offset: int = 0, 
     limit: int = Query(default=25, le=100),
+    cursor: str = None,
   ):
-    doctors = db.query(Doctor).where(Doctor.hospital_id == hospital_id).offset(offset).limit(limit).options(
+    query = select(Doctor).where(Doctor.hospital_id == hospital_id).options(
       defer(Doctor.password),
       joinedload(Doctor.hospital).load_only(Hospital.id, Hospital.name, Hospital.city, Hospital.address)
-    ).all()
+    )
+    result = await db.execute(paginate(query, Doctor, offset, limit, cursor))
+    doctors = result.scalars().all()
 
     return {
       "status": "successful",
       "message": f'successfully fetched all doctors from hospital - {hospital_id}',
-      "data": doctors
+      "data": doctors,
+      "next_cursor": next_cursor(doctors, limit, offset, cursor),
     }
   
 
@@ -248,26 +327,36 @@ class DoctorService:
 
   # retrieve doctor accounts by hospital id /general
   @staticmethod
+  @cached(
+    doctor_cache, 
+    # key n tag use the canonical spelling of the id, the one the invalidations use
+    lambda hospital_id, offset, limit, cursor, **_: f'hospital:{UUID(str(hospital_id))}:{offset}:{limit}:{cursor}', 
+    # tagged w the hospital even when the page is empty, its first doctor has to show up
+    tags=lambda response, hospital_id, **_: [f'hospital:{UUID(str(hospital_id))}', *page_tags(response)]
+  )
   async def retrieve_doctors_by_hospital_general(
-    hospital_id: str, 
-    db: Session,
+    hospital_id: UUID, 
+    db: AsyncSession,
     offset: int = 0, 
     limit: int = Query(default=25, le=100),
+    cursor: str = None,
   ):
-    doctors = db.query(Doctor).where(Doctor.hospital_id == hospital_id).offset(offset).limit(limit).options(
+    # created_at is loaded for the cursor but kept out of the general response
+    query = select(Doctor).where(Doctor.hospital_id == hospital_id).options(
       defer(Doctor.password),
-      defer(Doctor.created_at),
       defer(Doctor.updated_at),
       joinedload(Doctor.hospital).load_only(Hospital.id, Hospital.name, Hospital.city, Hospital.address)
-    ).all()
+    )
+    result = await db.execute(paginate(query, Doctor, offset, limit, cursor))
+    doctors = result.scalars().all()
 
     # transform the result for general users 
     result = [
       {
         "url": uuid_to_short_url(str(doctor.id)),
-        **{key: val for key, val in doctor.__dict__.items() if key != 'id'},
+        **{key: val for key, val in doctor.__dict__.items() if key not in ('id', 'created_at')},
         "hospital": {
-          "url": uuid_to_short_url(hospital_id),
+          "url": uuid_to_short_url(str(hospital_id)),
           **{key: val for key, val in doctor.hospital.__dict__.items() if key != 'id'}
         }
       }
@@ -279,6 +368,7 @@ class DoctorService:
       "status": "successful",
       "message": "successfully fetched all doctors!",
       "data": result,
+      "next_cursor": next_cursor(doctors, limit, offset, cursor),
     } 
   
 
@@ -0,0 +1,97 @@
+from datetime import datetime, timezone
+from typing import List
+from uuid import UUID
+from sqlalchemy import select, insert, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import BloodGlucoseReading
+from app.schemas.health import GlucoseReading, GlucoseBucket
+
+
+# readings and ranges w/o a timezone are treated as utc
+def as_utc(value: datetime | None) -> datetime | None:
+  if value is None or value.tzinfo:
+    return value
+  return value.replace(tzinfo=timezone.utc)
+
+
+
+class GlucoseService:
+  # retrieve the blood glucose readings of a patient ordered by measurement time
+  @staticmethod
+  async def retrieve_readings(patient_id: UUID, db: AsyncSession) -> List[GlucoseReading]:
+    result = await db.execute(
+      select(BloodGlucoseReading.value, BloodGlucoseReading.measured_at)
+      .where(BloodGlucoseReading.patient_id == patient_id)
+      .order_by(BloodGlucoseReading.measured_at)
+    )
+
+    return [GlucoseReading(value=row.value, measurement_time=row.measured_at) for row in result]
+
+
+
+  # append readings w a single multi row insert, the stored history is never rewritten
+  @staticmethod
+  async def append_readings(patient_id: UUID, readings: List[GlucoseReading], db: AsyncSession):
+    if not readings:
+      return
+
+    rows = [
+      {
+        "patient_id": patient_id,
+        "measured_at": as_utc(reading.measurement_time),
+        "value": reading.value,
+      }
+      for reading in readings
+    ]
+
+    await db.execute(insert(BloodGlucoseReading), rows)
+
+
+
+  # replace every reading of a patient, used by the full update (PUT) paths
+  @staticmethod
+  async def replace_readings(patient_id: UUID, readings: List[GlucoseReading], db: AsyncSession):
+    await db.execute(delete(BloodGlucoseReading).where(BloodGlucoseReading.patient_id == patient_id))
+    await GlucoseService.append_readings(patient_id, readings, db)
+
+
+
+  # downsample the readings of a time range into hour / day / week buckets inside postgres
+  @staticmethod
+  async def aggregate_readings(
+    patient_id: UUID, 
+    start: datetime, 
+    end: datetime, 
+    bucket: str, 
+    db: AsyncSession
+  ) -> List[GlucoseBucket]:
+    bucket_start = func.date_trunc(bucket, BloodGlucoseReading.measured_at).label('bucket_start')
+
+    result = await db.execute(
+      select(
+        bucket_start,
+        func.min(BloodGlucoseReading.value).label('min'),
+        func.max(BloodGlucoseReading.value).label('max'),
+        func.avg(BloodGlucoseReading.value).label('mean'),
+        func.count().label('count'),
+      )
+      .where(
+        BloodGlucoseReading.patient_id == patient_id,
+        BloodGlucoseReading.measured_at >= start,
+        BloodGlucoseReading.measured_at < end,
+      )
+      .group_by(bucket_start)
+      .order_by(bucket_start)
+    )
+
+    return [
+      GlucoseBucket(
+        bucket_start=row.bucket_start,
+        min=row.min,
+        max=row.max,
+        mean=round(float(row.mean), 2),
+        count=row.count,
+      )
+      for row in result
+    ]
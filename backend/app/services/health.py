@@ -1,18 +1,28 @@
 from fastapi import HTTPException, Query
-from sqlalchemy import func
-from sqlalchemy.orm import Session, defer
+from sqlalchemy import func, select, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
+from datetime import datetime, timedelta, timezone
 
 from app.models import Patient, HealthRecord
 from app.schemas.health import HealthRecordUpdate, HealthRecordResponse, BloodGlucose, BloodPressure, HealthRecordUpdateAdmin
 from app.core.security import short_url_to_uuid, uuid_to_short_url
 from app.core.utils import ResponseHandler
+from app.core.pagination import paginate, next_cursor
+from app.core.batch import delete_by_ids
+from app.core.updates import update_returning
+from app.core.cache import NegativeCache
+from app.services.glucose import GlucoseService, as_utc
+
+
+# health record ids recently found missing, the update endpoints answer them w/o a query
+missing_records = NegativeCache('health_records')
 
 
 class HealthMonitorings:
   # get health record of patient by id
   @staticmethod
-  async def get_health_record_details(patient_id: str, session_user: Patient, db: Session):
+  async def get_health_record_details(patient_id: str, session_user: Patient, db: AsyncSession):
     user_id = short_url_to_uuid(patient_id) # get the original uuid from the url 
 
     # check if requested user matches w session user
@@ -20,7 +30,8 @@ class HealthMonitorings:
       raise ResponseHandler.no_permission(f'user does not have permission - {user_id}')
     
     # get the health record details
-    health_record = db.query(HealthRecord).where(HealthRecord.patient_id == user_id).first()
+    result = await db.execute(select(HealthRecord).where(HealthRecord.patient_id == user_id))
+    health_record = result.scalars().first()
 
     if not health_record:
       return {
@@ -49,7 +60,7 @@ class HealthMonitorings:
         physical_activity = health_record.physical_activity, 
         previous_diabetes_records = health_record.previous_diabetes_records, 
         blood_pressure_records = health_record.blood_pressure_records, 
-        blood_glucose_records = health_record.blood_glucose_records, 
+        blood_glucose_records = await GlucoseService.retrieve_readings(user_id, db), 
         body_temperature = health_record.body_temperature, 
         blood_oxygen = health_record.blood_oxygen, 
         bmi = health_record.bmi 
@@ -63,7 +74,7 @@ class HealthMonitorings:
     health_records: HealthRecordUpdate, 
     patient_id: str, 
     session_user: Patient, 
-    db: Session
+    db: AsyncSession
   ):
     user_id = short_url_to_uuid(patient_id) # get the original uuid from the url 
 
@@ -88,8 +99,9 @@ class HealthMonitorings:
     
     db_health_records = HealthRecord(**payload)
     db.add(db_health_records)
-    db.commit()
-    db.refresh(db_health_records)
+    await db.commit()
+    await db.refresh(db_health_records)
+    await missing_records.discard([db_health_records.id])
 
     # generated short url using health record id 
     url = uuid_to_short_url(str(db_health_records.id)) 
@@ -118,19 +130,12 @@ class HealthMonitorings:
     updated_data: HealthRecordUpdate, 
     record_id: str, 
     session_user: Patient, 
-    db: Session
+    db: AsyncSession
   ):
     health_record_id = short_url_to_uuid(record_id) # get the original uuid from the url   
-    
-    # get the health record details
-    health_record = db.query(HealthRecord).where(HealthRecord.id == health_record_id).first()
-    
-    if not health_record:
-      raise ResponseHandler.not_found_error(f'health record not found - {record_id}')
 
-    # # if the requested account id doesn't matches w session user id
-    if health_record.patient_id != session_user.id:
-      raise ResponseHandler.no_permission(f'user does not have permission - {session_user.id}')
+    if missing_records.contains(health_record_id):
+      raise ResponseHandler.not_found_error(f'health record not found - {record_id}')
     
     # raise custom error if no field was provided  
     if(updated_data.is_empty()):
@@ -149,27 +154,38 @@ class HealthMonitorings:
       updated_payload['bmi'] = round(updated_data.weight / (height_meters**2), 2)
 
 
-    db.query(HealthRecord).where(HealthRecord.id == health_record_id).update(updated_payload)
-    db.commit()
-    db.refresh(health_record)
+    # the ownership check is part of the update itself
+    health_record = await update_returning(HealthRecord, health_record_id, updated_payload, db, HealthRecord.patient_id == session_user.id)
+
+    if not health_record:
+      result = await db.execute(select(HealthRecord.id).where(HealthRecord.id == health_record_id))
+
+      if not result.scalar():
+        missing_records.add(health_record_id)
+        raise ResponseHandler.not_found_error(f'health record not found - {record_id}')
+
+      # if the requested account id doesn't matches w session user id
+      raise ResponseHandler.no_permission(f'user does not have permission - {session_user.id}')
+
+    await db.commit()
 
 
     return {
       "status": "successful",
-      "message": f"successfully updated health record - {health_record.id}!",
+      "message": f"successfully updated health record - {health_record['id']}!",
       "data": HealthRecordResponse(
         url = record_id,
-        weight = health_record.weight,
-        height = health_record.height, 
-        blood_group = health_record.blood_group, 
-        smoking_status = health_record.smoking_status, 
-        physical_activity = health_record.physical_activity, 
-        previous_diabetes_records = health_record.previous_diabetes_records, 
-        body_temperature = health_record.body_temperature, 
-        blood_oxygen = health_record.blood_oxygen,
-        bmi=health_record.bmi,
-        blood_pressure_records=health_record.blood_pressure_records,
-        blood_glucose_records=health_record.blood_glucose_records
+        weight = health_record['weight'],
+        height = health_record['height'], 
+        blood_group = health_record['blood_group'], 
+        smoking_status = health_record['smoking_status'], 
+        physical_activity = health_record['physical_activity'], 
+        previous_diabetes_records = health_record['previous_diabetes_records'], 
+        body_temperature = health_record['body_temperature'], 
+        blood_oxygen = health_record['blood_oxygen'],
+        bmi=health_record['bmi'],
+        blood_pressure_records=health_record['blood_pressure_records'],
+        blood_glucose_records=await GlucoseService.retrieve_readings(health_record['patient_id'], db)
       )
     }
   
@@ -179,14 +195,19 @@ class HealthMonitorings:
     updated_data: BloodPressure, 
     record_id: str, 
     session_user: Patient, 
-    db: Session
+    db: AsyncSession
   ):
     health_record_id = short_url_to_uuid(record_id) # get the original uuid from the url   
+
+    if missing_records.contains(health_record_id):
+      raise ResponseHandler.not_found_error(f'health record not found - {record_id}')
     
     # get the health record details
-    health_record = db.query(HealthRecord).where(HealthRecord.id == health_record_id).first()
+    result = await db.execute(select(HealthRecord).where(HealthRecord.id == health_record_id))
+    health_record = result.scalars().first()
     
     if not health_record:
+      missing_records.add(health_record_id)
       raise ResponseHandler.not_found_error(f'health record not found - {record_id}')
 
     # # if the requested account id doesn't matches w session user id
@@ -205,9 +226,9 @@ class HealthMonitorings:
     updated_payload = { "updated_at": func.now(), **updated_data.model_dump() }
 
 
-    db.query(HealthRecord).where(HealthRecord.id == health_record_id).update(updated_payload)
-    db.commit()
-    db.refresh(health_record)
+    await db.execute(update(HealthRecord).where(HealthRecord.id == health_record_id).values(updated_payload))
+    await db.commit()
+    await db.refresh(health_record)
 
     
     return {
@@ -225,14 +246,19 @@ class HealthMonitorings:
     updated_data: BloodGlucose, 
     record_id: str, 
     session_user: Patient, 
-    db: Session
+    db: AsyncSession
   ):
     health_record_id = short_url_to_uuid(record_id) # get the original uuid from the url   
+
+    if missing_records.contains(health_record_id):
+      raise ResponseHandler.not_found_error(f'health record not found - {record_id}')
     
     # get the health record details
-    health_record = db.query(HealthRecord).where(HealthRecord.id == health_record_id).first()
+    result = await db.execute(select(HealthRecord).where(HealthRecord.id == health_record_id))
+    health_record = result.scalars().first()
     
     if not health_record:
+      missing_records.add(health_record_id)
       raise ResponseHandler.not_found_error(f'health record not found - {record_id}')
 
     # # if the requested account id doesn't matches w session user id
@@ -246,38 +272,108 @@ class HealthMonitorings:
         detail=f"updating health record failed, no field was provided - {record_id}"
       )
     
-    # update the blood glucose records 
-    updated_payload = { "updated_at": func.now(), **updated_data.model_dump() }
-
-    db.query(HealthRecord).where(HealthRecord.id == health_record_id).update(updated_payload)
-    db.commit()
-    db.refresh(health_record)
+    # replace the blood glucose readings of the patient 
+    await GlucoseService.replace_readings(health_record.patient_id, updated_data.blood_glucose_records, db)
+    await db.commit()
 
     
     return {
       "status": "successful",
       "message": f"successfully updated blood glucose record - {health_record.id}!",
       "data": BloodGlucose(
-        blood_glucose_records=health_record.blood_glucose_records
+        blood_glucose_records=await GlucoseService.retrieve_readings(health_record.patient_id, db)
       )
     }
+
+
+
+  # append new blood glucose readings using patient id 
+  @staticmethod 
+  async def append_blood_glucose_readings(
+    new_readings: BloodGlucose, 
+    patient_id: str, 
+    session_user: Patient, 
+    db: AsyncSession
+  ):
+    user_id = short_url_to_uuid(patient_id) # get the original uuid from the url 
+
+    # check if requested user matches w session user
+    if user_id != session_user.id: 
+      raise ResponseHandler.no_permission(f'user does not have permission - {patient_id}')
+
+    # raise custom error if no reading was provided  
+    if not new_readings.blood_glucose_records:
+      raise HTTPException(
+        status_code=400,
+        detail=f"adding blood glucose readings failed, no reading was provided - {patient_id}"
+      )
+
+    # a single insert regardless of how long the stored history is
+    await GlucoseService.append_readings(user_id, new_readings.blood_glucose_records, db)
+    await db.commit()
+
+
+    return {
+      "status": "successful",
+      "message": f"successfully added {len(new_readings.blood_glucose_records)} blood glucose readings - {user_id}!",
+      "data": new_readings
+    }
   
 
 
+  # get blood glucose statistics of a time range grouped into hour / day / week buckets
+  @staticmethod 
+  async def get_blood_glucose_summary(
+    patient_id: str, 
+    start: datetime | None, 
+    end: datetime | None, 
+    bucket: str, 
+    session_user: Patient, 
+    db: AsyncSession
+  ):
+    user_id = short_url_to_uuid(patient_id) # get the original uuid from the url 
+
+    # check if requested user matches w session user
+    if user_id != session_user.id: 
+      raise ResponseHandler.no_permission(f'user does not have permission - {patient_id}')
+
+    # default to the last 90 days
+    end = as_utc(end) or datetime.now(timezone.utc)
+    start = as_utc(start) or end - timedelta(days=90)
+
+    if start >= end:
+      raise HTTPException(
+        status_code=400,
+        detail=f"invalid time range, start must be before end - {patient_id}"
+      )
+
+    buckets = await GlucoseService.aggregate_readings(user_id, start, end, bucket, db)
+
+    return {
+      "status": "successful",
+      "message": f"successfully fetched blood glucose summary - {user_id}",
+      "data": buckets
+    }
+
+
+
   # retrive all the patient health records /admin
   @staticmethod
   async def retrieve_all_health_records_admin(
-    db: Session,
+    db: AsyncSession,
     offset: int = 0, 
     # this way it adds a layer of constraint, asking the parameter either be 100 or less than 100
     limit: int = Query(default=25, le=100),
+    cursor: str = None,
   ):
-    health_records = db.query(HealthRecord).offset(offset).limit(limit).all()
+    result = await db.execute(paginate(select(HealthRecord), HealthRecord, offset, limit, cursor))
+    health_records = result.scalars().all()
     
     return {
       "status": "successful",
       "message": "successfully fetched all health records!",
       "data": health_records,
+      "next_cursor": next_cursor(health_records, limit, offset, cursor),
     }
 
 
@@ -287,21 +383,24 @@ class HealthMonitorings:
   @staticmethod
   async def get_patient_health_record_admin(
     patient_id: str, 
-    db: Session
+    db: AsyncSession
   ):
-    patient = db.query(Patient).where(Patient.id == patient_id).first()
+    result = await db.execute(select(Patient).where(Patient.id == patient_id))
+    patient = result.scalars().first()
 
     # check if the patient exists
     if not patient:
       raise ResponseHandler.not_found_error(f'patient does not exists - {patient_id}')
     
     
-    health_records = db.query(HealthRecord).where(HealthRecord.patient_id == patient_id).all()
+    result = await db.execute(select(HealthRecord).where(HealthRecord.patient_id == patient_id))
+    health_records = result.scalars().all()
     
     return {
       "status": "successful",
       "message": f"successfully fetched patient health record - {patient_id}",
-      "data": health_records
+      "data": health_records,
+      "blood_glucose_records": await GlucoseService.retrieve_readings(patient.id, db)
     }
   
 
@@ -311,9 +410,10 @@ class HealthMonitorings:
   async def create_patient_health_record_admin(
     patient_id: str,
     details: HealthRecordUpdateAdmin,
-    db: Session
+    db: AsyncSession
   ):
-    patient = db.query(Patient).where(Patient.id == patient_id).first()
+    result = await db.execute(select(Patient).where(Patient.id == patient_id))
+    patient = result.scalars().first()
 
     # check if the patient exists
     if not patient:
@@ -327,6 +427,7 @@ class HealthMonitorings:
       )
     
     payload = { 'patient_id': patient.id, **details.none_excluded() }
+    payload.pop('blood_glucose_records', None) # readings are stored in their own table
     
     # calculate the bmi from with the weight n height
     if details.height and details.weight:
@@ -336,8 +437,10 @@ class HealthMonitorings:
     db_health_record = HealthRecord(**payload)
     
     db.add(db_health_record)
-    db.commit()
-    db.refresh(db_health_record)
+    await GlucoseService.append_readings(patient.id, details.blood_glucose_records, db)
+    await db.commit()
+    await db.refresh(db_health_record)
+    await missing_records.discard([db_health_record.id])
 
     return {
       "status": "successful",
@@ -353,9 +456,10 @@ class HealthMonitorings:
   async def update_patient_health_record_admin(
     record_id: str, 
     details: HealthRecordUpdateAdmin, 
-    db: Session
+    db: AsyncSession
   ):
-    health_record = db.query(HealthRecord).where(HealthRecord.id == record_id).first()
+    result = await db.execute(select(HealthRecord).where(HealthRecord.id == record_id))
+    health_record = result.scalars().first()
     
     # check if health record exists
     if not health_record:
@@ -372,6 +476,7 @@ class HealthMonitorings:
 
     # update the health record details 
     updated_payload = { "updated_at": func.now(), **details.none_excluded() }
+    updated_payload.pop('blood_glucose_records', None) # readings are stored in their own table
 
     # calculate the bmi from with the weight n height
     if details.height and details.weight:
@@ -379,9 +484,13 @@ class HealthMonitorings:
       updated_payload['bmi'] = round(details.weight / (height_meters**2), 2)
 
 
-    db.query(HealthRecord).where(HealthRecord.id == health_record.id).update(updated_payload)
-    db.commit()
-    db.refresh(health_record)
+    await db.execute(update(HealthRecord).where(HealthRecord.id == health_record.id).values(updated_payload))
+
+    if details.blood_glucose_records is not None:
+      await GlucoseService.replace_readings(health_record.patient_id, details.blood_glucose_records, db)
+
+    await db.commit()
+    await db.refresh(health_record)
 
 
     return {
@@ -394,14 +503,15 @@ class HealthMonitorings:
   
 
   # delete patient health record using record id /admin 
-  async def delete_patient_health_record_admin(record_id: str, db: Session):
-    targeted_health_record = db.query(HealthRecord).where(HealthRecord.id == record_id).first()
+  async def delete_patient_health_record_admin(record_id: str, db: AsyncSession):
+    result = await db.execute(select(HealthRecord).where(HealthRecord.id == record_id))
+    targeted_health_record = result.scalars().first()
   
     if not targeted_health_record:
       raise ResponseHandler.not_found_error(f'user-{id} not found!')
     
-    db.delete(targeted_health_record)
-    db.commit()
+    await db.delete(targeted_health_record)
+    await db.commit()
 
     return {
       "status": "successful",
@@ -413,22 +523,16 @@ class HealthMonitorings:
 
   # delete a batch of user accounts /admin
   @staticmethod
-  async def delete_patient_health_record_batch_admin(ids: List[str], db: Session):
-    # get the target health records 
-    targeted_health_records = db.query(HealthRecord).filter(HealthRecord.id.in_(ids)).all()
-    
-    # get the missing ids if there is any
-    existing_ids = [str(user.id) for user in targeted_health_records]
-    missing_ids = list(set(ids) - set(existing_ids))
+  async def delete_patient_health_record_batch_admin(ids: List[str], db: AsyncSession):
+    # delete the targeted health records in a single round trip per chunk, the returned ids tell which existed
+    existing_ids, missing_ids = await delete_by_ids(HealthRecord, ids, db)
     missing_message = None
 
-    # if targeted health record not found
+    # if targeted health records not found
     if len(existing_ids) == 0:
       raise ResponseHandler.not_found_error("health record " +  ", ".join(missing_ids) + " has not been found!")
 
-    # delete the targeted health records 
-    db.query(HealthRecord).filter(HealthRecord.id.in_(ids)).delete(synchronize_session=False)
-    db.commit()
+    await db.commit()
 
     # custom message when some of the ids are missing 
     if len(missing_ids) > 0:
@@ -1,6 +1,7 @@
 from fastapi import Query, HTTPException
-from sqlalchemy.orm import Session, defer, joinedload
-from sqlalchemy import func
+from sqlalchemy.orm import defer
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select, update, delete, or_
 from typing import List
 
 
@@ -8,29 +9,47 @@ from app.core.security import uuid_to_short_url, short_url_to_uuid
 from app.models import Hospital, Doctor
 from app.schemas.hospital import HospitalBase, HospitalCreateAdmin, HospitalUpdateAdmin
 from app.core.utils import ResponseHandler
+from app.core.pagination import paginate, next_cursor
+from app.core.batch import delete_by_ids
+from app.core.updates import update_returning
+from app.core.cache import ResponseCache, NegativeCache, cached
+from app.core.config import settings
+from app.services.doctor import doctor_cache
+
+
+# public hospital responses, they only change when an admin edits a hospital
+hospital_cache = ResponseCache('hospitals', stale_ttl=settings.cache_stale_ttl)
+missing_hospitals = NegativeCache('hospitals')
 
 
 
 class HospitalService:
   # retrieve all hospital informations /general
   @staticmethod
+  @cached(
+    hospital_cache, 
+    'all:{offset}:{limit}:{cursor}', 
+    # every page is tagged w its hospitals, so editing one only drops the pages showing it
+    tags=lambda response, **_: ['list', *(f"hospital:{short_url_to_uuid(hospital['url'])}" for hospital in response['data'])]
+  )
   async def retrieve_all_hospitals(
-    db: Session,
+    db: AsyncSession,
     offset: int = 0, 
     # this way it adds a layer of constraint, asking the parameter either be 100 or less than 100
     limit: int = Query(default=100, le=100),
+    cursor: str = None,
   ):
-    hospitals = db.query(Hospital).offset(offset).limit(limit).options(
-      defer(Hospital.updated_at),
-      defer(Hospital.created_at)
-    ).all()
+    # created_at is loaded for the cursor but kept out of the general response
+    query = select(Hospital).options(defer(Hospital.updated_at))
+    result = await db.execute(paginate(query, Hospital, offset, limit, cursor))
+    hospitals = result.scalars().all()
 
 
     # transform the result for general users 
     result = [
       {
         "url": uuid_to_short_url(str(hospital.id)),
-        **{key: val for key, val in hospital.__dict__.items() if key != 'id' }
+        **{key: val for key, val in hospital.__dict__.items() if key not in ('id', 'created_at') }
       }
       for hospital in hospitals
     ]
@@ -40,18 +59,27 @@ class HospitalService:
       "status": "successful",
       "message": "successfully fetched all hospitals!",
       "data": result,
+      "next_cursor": next_cursor(hospitals, limit, offset, cursor),
     } 
   
 
   @staticmethod 
-  async def get_hospital_information(id: str, db: Session):
+  @cached(hospital_cache, lambda id, **_: f'profile:{short_url_to_uuid(id)}')
+  async def get_hospital_information(id: str, db: AsyncSession):
     hospital_id = short_url_to_uuid(id)
-    hospital = db.query(Hospital).where(Hospital.id == hospital_id).options(
+
+    # ids recently found missing are answered w/o a query
+    if missing_hospitals.contains(hospital_id):
+      raise ResponseHandler.not_found_error(f'hospital not found - {id}')
+
+    result = await db.execute(select(Hospital).where(Hospital.id == hospital_id).options(
       defer(Hospital.created_at),
       defer(Hospital.updated_at)
-    ).first()
+    ))
+    hospital = result.scalars().first()
 
     if not hospital:
+      missing_hospitals.add(hospital_id)
       raise ResponseHandler.not_found_error(f'hospital not found - {id}')
     
     return {
@@ -71,14 +99,56 @@ class HospitalService:
     }
 
 
+  # find hospitals listing the given email or contact number /general
+  @staticmethod 
+  async def find_hospitals_by_contact(email: str | None, contact_number: str | None, db: AsyncSession):
+    if not email and not contact_number:
+      raise HTTPException(
+        status_code=400,
+        detail='looking up hospitals failed, provide an email or a contact number!'
+      )
+
+    # containment (@>) lookups are served by the gin indexes instead of scanning every row
+    conditions = []
+    if email:
+      conditions.append(Hospital.emails.contains([email]))
+    if contact_number:
+      conditions.append(Hospital.contact_numbers.contains([contact_number]))
+
+    result = await db.execute(select(Hospital).where(or_(*conditions)).options(
+      defer(Hospital.created_at),
+      defer(Hospital.updated_at)
+    ))
+    hospitals = result.scalars().all()
+
+    # transform the result for general users 
+    result = [
+      {
+        "url": uuid_to_short_url(str(hospital.id)),
+        **{key: val for key, val in hospital.__dict__.items() if key != 'id' }
+      }
+      for hospital in hospitals
+    ]
+
+    return {
+      "status": "successful",
+      "message": f"successfully found {len(result)} hospitals!",
+      "data": result,
+    }
+
+
   # create a new patient account /admin
   @staticmethod
-  async def create_hospital_account_admin(details: HospitalCreateAdmin, db: Session):
+  async def create_hospital_account_admin(details: HospitalCreateAdmin, db: AsyncSession):
     new_hospital = Hospital(**details.model_dump())
     
     db.add(new_hospital)
-    db.commit()
-    db.refresh(new_hospital)
+    await db.commit()
+    await db.refresh(new_hospital)
+
+    # the new hospital shifts every page of the listing
+    await hospital_cache.invalidate(tags=['list'])
+    await missing_hospitals.discard([new_hospital.id])
 
     return {
       "status": "successful",
@@ -91,17 +161,20 @@ class HospitalService:
   # retrieve all hospital informations /admin
   @staticmethod
   async def retrieve_all_hospitals_admin(
-    db: Session,
+    db: AsyncSession,
     offset: int = 0, 
     # this way it adds a layer of constraint, asking the parameter either be 100 or less than 100
     limit: int = Query(default=100, le=100),
+    cursor: str = None,
   ):
-    hospitals = db.query(Hospital).offset(offset).limit(limit).all()
+    result = await db.execute(paginate(select(Hospital), Hospital, offset, limit, cursor))
+    hospitals = result.scalars().all()
     
     return {
       "status": "successful",
       "message": "successfully fetched all hospitals!",
       "data": hospitals,
+      "next_cursor": next_cursor(hospitals, limit, offset, cursor),
     } 
   
 
@@ -109,8 +182,9 @@ class HospitalService:
   
   # get hospital information using id /admin
   @staticmethod
-  async def get_hospital_information_admin(id: str, db: Session):
-    hospital = db.query(Hospital).where(Hospital.id == id).first()
+  async def get_hospital_information_admin(id: str, db: AsyncSession):
+    result = await db.execute(select(Hospital).where(Hospital.id == id))
+    hospital = result.scalars().first()
 
     if not hospital:
       raise ResponseHandler.not_found_error(f'hospital not found - {id}')
@@ -126,45 +200,51 @@ class HospitalService:
 
   # update hospital information using id /admin
   @staticmethod 
-  async def update_hospital_information_admin(id: str, details: HospitalUpdateAdmin, db: Session):
-    hospital = db.query(Hospital).where(Hospital.id == id).first()
-
-    # if no patient found 
-    if not hospital:
-      raise ResponseHandler.not_found_error(f'hospital not found - {id}')
-
+  async def update_hospital_information_admin(id: str, details: HospitalUpdateAdmin, db: AsyncSession):
     # handle if no if the body is empty
     if(details.is_empty()):
       raise HTTPException(
         status_code=400,
-        detail=f"updating hospital failed, no field was provided - {hospital.id}"
+        detail=f"updating hospital failed, no field was provided - {id}"
       )
 
-    # update the hospital information
+    # update the hospital information n get the updated row back in the same round trip
     payload = { "updated_at": func.now(), **details.none_excluded() }
-    db.query(Hospital).where(Hospital.id == id).update(payload)
+    hospital = await update_returning(Hospital, id, payload, db)
+
+    # if no hospital found 
+    if not hospital:
+      raise ResponseHandler.not_found_error(f'hospital not found - {id}')
     
-    db.commit()
-    db.refresh(hospital)
+    await db.commit()
+
+    # only the profile n the pages showing this hospital are stale
+    await hospital_cache.invalidate(keys=[f"profile:{hospital['id']}"], tags=[f"hospital:{hospital['id']}"])
+    await doctor_cache.invalidate(tags=[f"hospital:{hospital['id']}"]) # doctor listings embed the hospital
 
 
     return {
       "status": "successful",
-      "message": f"successfully updated hospital information - {hospital.id}",
+      "message": f"successfully updated hospital information - {hospital['id']}",
       "data": hospital
     }
 
 
   # delete hospital using hospital id /admin
   @staticmethod
-  async def delete_hospital_admin(id: str, db: Session):
-    targeted_hospital = db.query(Hospital).where(Hospital.id == id).first()
+  async def delete_hospital_admin(id: str, db: AsyncSession):
+    result = await db.execute(select(Hospital).where(Hospital.id == id))
+    targeted_hospital = result.scalars().first()
   
     if not targeted_hospital:
       raise ResponseHandler.not_found_error(f'hospital not found - {id}')
     
-    db.delete(targeted_hospital)
-    db.commit()
+    await db.delete(targeted_hospital)
+    await db.commit()
+
+    # removing a hospital shifts every page after it
+    await hospital_cache.invalidate(keys=[f'profile:{targeted_hospital.id}'], tags=['list'])
+    await doctor_cache.invalidate(tags=['list', f'hospital:{targeted_hospital.id}']) # its doctors are deleted w it
 
     return {
       "status": "successful",
@@ -175,21 +255,18 @@ class HospitalService:
 
   # delete a batch of user accounts /admin
   @staticmethod
-  async def delete_hospital_batch_admin(ids: List[str], db: Session):
-    targeted_hospitals = db.query(Hospital).filter(Hospital.id.in_(ids)).all()
-    
-    # get the missing ids if there is any
-    existing_ids = [str(hospital.id) for hospital in targeted_hospitals]
-    missing_ids = list(set(ids) - set(existing_ids))
+  async def delete_hospital_batch_admin(ids: List[str], db: AsyncSession):
+    # delete the targeted hospitals in a single round trip per chunk, the returned ids tell which existed
+    existing_ids, missing_ids = await delete_by_ids(Hospital, ids, db)
     missing_message = None
 
     # if targeted hospitals not found
     if len(existing_ids) == 0:
       raise ResponseHandler.not_found_error("hospital " +  ", ".join(missing_ids) + " has not been found!")
 
-    # delete the targeted hospitals 
-    db.query(Hospital).filter(Hospital.id.in_(ids)).delete(synchronize_session=False)
-    db.commit()
+    await db.commit()
+    await hospital_cache.invalidate(keys=[f'profile:{id}' for id in existing_ids], tags=['list'])
+    await doctor_cache.invalidate(tags=['list', *(f'hospital:{id}' for id in existing_ids)])
 
     # custom message when some of the ids are missing 
     if len(missing_ids) > 0:
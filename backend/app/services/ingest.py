@@ -0,0 +1,327 @@
+import csv
+import codecs
+import json
+import numpy as np
+from billiard.pool import Pool
+from uuid import UUID, uuid4
+from typing import AsyncIterator, Callable, List
+from pydantic import ValidationError
+from sqlalchemy import select, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import TaskSessionLocal
+from app.models import User, Patient
+from app.schemas.health import HealthRecordUpdateAdmin
+from app.schemas.users import PatientCreateAdmin
+from app.core.security import hash_encrypted_password
+from app.services.glucose import as_utc
+from app.workers.celery import celery
+
+
+# rows validated n copied per round trip, bounds the memory used by one upload
+CHUNK_SIZE = 5000
+
+# per row errors returned in the response, the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+
+# csv cells holding a json array
+JSON_FIELDS = ('previous_diabetes_records', 'blood_pressure_records', 'blood_glucose_records')
+
+HEALTH_RECORD_COLUMNS = [
+  'id', 'patient_id', 'weight', 'height', 'blood_group', 'smoking_status', 'physical_activity',
+  'previous_diabetes_records', 'blood_pressure_records', 'body_temperature', 'blood_oxygen', 'bmi',
+]
+GLUCOSE_READING_COLUMNS = ['id', 'patient_id', 'measured_at', 'value']
+
+# accounts hashed n inserted per batch, 1000 rows stay well below the bind parameter limit of postgres
+ACCOUNT_BATCH_SIZE = 1000
+USER_COLUMNS = ('email', 'name', 'gender', 'img_src', 'address')
+PATIENT_COLUMNS = ('profession', 'date_of_birth', 'contact_number', 'emergency_number')
+
+
+
+# split a streamed request body into text lines w/o buffering the whole upload
+async def iter_lines(stream: AsyncIterator[bytes]):
+  decoder = codecs.getincrementaldecoder('utf-8')()
+  pending = ''
+
+  async for chunk in stream:
+    pending += decoder.decode(chunk)
+    *lines, pending = pending.split('\n')
+
+    for line in lines:
+      yield line.rstrip('\r')
+
+  pending += decoder.decode(b'', final=True)
+  if pending:
+    yield pending.rstrip('\r')
+
+
+
+# turn every non blank line into a raw row dictionary, numbered from 1 (excluding the csv header)
+async def iter_rows(stream: AsyncIterator[bytes], format: str):
+  header = None
+  number = 0
+
+  async for line in iter_lines(stream):
+    if not line.strip():
+      continue
+
+    if format == 'csv' and header is None:
+      header = [column.strip() for column in next(csv.reader([line]))]
+      continue
+
+    number += 1
+
+    try:
+      if format == 'ndjson':
+        row = json.loads(line)
+      else:
+        values = next(csv.reader([line]))
+        row = { key: val for key, val in zip(header, values) if val != '' }
+
+        for field in JSON_FIELDS:
+          if field in row:
+            row[field] = json.loads(row[field])
+
+      if not isinstance(row, dict):
+        raise ValueError('row is not an object')
+    except ValueError as e:
+      yield number, None, str(e)
+      continue
+
+    yield number, row, None
+
+
+
+# bmi of a whole chunk in one go, rows missing the weight or the height get none
+def calculate_bmi(weights: List[float | None], heights: List[float | None]):
+  weights = np.array(weights, dtype=float)
+  height_meters = np.array(heights, dtype=float) * 0.3048
+
+  with np.errstate(divide='ignore', invalid='ignore'):
+    bmi = np.round(weights / height_meters**2, 2)
+
+  return [None if not np.isfinite(val) else float(val) for val in bmi]
+
+
+
+class HealthRecordIngestion:
+  # bulk ingest health records from a csv or ndjson body using postgres copy /admin
+  @staticmethod
+  async def ingest_health_records_admin(stream: AsyncIterator[bytes], format: str, db: AsyncSession):
+    summary = { "received": 0, "inserted": 0, "failed": 0, "errors": [] }
+    chunk = []
+
+    def reject(number: int, errors):
+      summary["failed"] += 1
+      if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+        summary["errors"].append({ "row": number, "errors": errors })
+
+    async for number, row, error in iter_rows(stream, format):
+      summary["received"] += 1
+
+      if error:
+        reject(number, [error])
+        continue
+
+      try:
+        patient_id = UUID(str(row.pop('patient_id', None)))
+      except ValueError:
+        reject(number, ['patient_id is missing or not a valid uuid'])
+        continue
+
+      # validate w the same schema as the single record endpoint
+      try:
+        details = HealthRecordUpdateAdmin.model_validate(row)
+      except ValidationError as e:
+        reject(number, e.errors(include_url=False, include_context=False, include_input=False))
+        continue
+
+      if details.is_empty():
+        reject(number, ['no field was provided'])
+        continue
+
+      chunk.append((number, patient_id, details))
+
+      if len(chunk) >= CHUNK_SIZE:
+        summary["inserted"] += await HealthRecordIngestion.copy_chunk(chunk, reject, db)
+        chunk = []
+
+    if chunk:
+      summary["inserted"] += await HealthRecordIngestion.copy_chunk(chunk, reject, db)
+
+    summary["errors"].sort(key=lambda error: error["row"]) # unknown patients are only found per chunk
+    summary["errors_truncated"] = summary["failed"] > len(summary["errors"])
+
+    return {
+      "status": "successful",
+      "message": f"successfully ingested {summary['inserted']} of {summary['received']} health records!",
+      "data": summary,
+    }
+
+
+
+  # copy one validated chunk into health_records n blood_glucose_readings, committed on its own
+  @staticmethod
+  async def copy_chunk(chunk: list, reject, db: AsyncSession) -> int:
+    # a single set based lookup instead of one query per row
+    result = await db.execute(select(Patient.id).where(Patient.id.in_({patient_id for _, patient_id, _ in chunk})))
+    existing = set(result.scalars().all())
+
+    rows = []
+    for number, patient_id, details in chunk:
+      if patient_id in existing:
+        rows.append((patient_id, details))
+      else:
+        reject(number, [f'patient does not exists - {patient_id}'])
+
+    if not rows:
+      return 0
+
+    bmi = calculate_bmi([details.weight for _, details in rows], [details.height for _, details in rows])
+
+    records = []
+    readings = []
+    for (patient_id, details), record_bmi in zip(rows, bmi):
+      payload = details.model_dump(mode='json', exclude={'blood_glucose_records'})
+      records.append((
+        uuid4(), patient_id, details.weight, details.height, details.blood_group, details.smoking_status,
+        details.physical_activity,
+        json.dumps(payload['previous_diabetes_records']) if details.previous_diabetes_records is not None else None,
+        json.dumps(payload['blood_pressure_records']) if details.blood_pressure_records is not None else None,
+        details.body_temperature, details.blood_oxygen, record_bmi,
+      ))
+      readings.extend(
+        (uuid4(), patient_id, as_utc(reading.measurement_time), reading.value)
+        for reading in details.blood_glucose_records or []
+      )
+
+    # copy goes straight through the asyncpg driver connection of this session
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    driver = raw_connection.driver_connection
+
+    await driver.copy_records_to_table('health_records', records=records, columns=HEALTH_RECORD_COLUMNS)
+    if readings:
+      await driver.copy_records_to_table('blood_glucose_readings', records=readings, columns=GLUCOSE_READING_COLUMNS)
+
+    await db.commit()
+
+    return len(records)
+
+
+
+
+class PatientAccountImport:
+  # validate a streamed file of patient accounts n hand the import over to celery /admin
+  @staticmethod
+  async def import_patient_accounts_admin(stream: AsyncIterator[bytes], format: str, db: AsyncSession):
+    summary = { "received": 0, "queued": 0, "failed": 0, "errors": [] }
+    accounts = {} # email -> (row number, account)
+
+    def reject(number: int, errors):
+      summary["failed"] += 1
+      if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+        summary["errors"].append({ "row": number, "errors": errors })
+
+    async for number, row, error in iter_rows(stream, format):
+      summary["received"] += 1
+
+      if error:
+        reject(number, [error])
+        continue
+
+      try:
+        account = PatientCreateAdmin.model_validate(row)
+      except ValidationError as e:
+        reject(number, e.errors(include_url=False, include_context=False, include_input=False))
+        continue
+
+      if account.email in accounts:
+        reject(number, [f'duplicate email in the file - {account.email}'])
+        continue
+
+      accounts[account.email] = (number, account)
+
+    # one set based query per batch of emails instead of an existence check per account
+    emails = list(accounts)
+    for i in range(0, len(emails), CHUNK_SIZE):
+      result = await db.execute(select(User.email).where(User.email.in_(emails[i:i + CHUNK_SIZE])))
+
+      for email in result.scalars().all():
+        number, _ = accounts.pop(email)
+        reject(number, [f'patient already exists - {email}'])
+
+    summary["errors"].sort(key=lambda error: error["row"])
+    summary["errors_truncated"] = summary["failed"] > len(summary["errors"])
+    summary["queued"] = len(accounts)
+    summary["task_id"] = None
+
+    # passwords stay encrypted on the broker, the worker decrypts n hashes them
+    if accounts:
+      task = celery.send_task(
+        "app.workers.tasks.import_patients", 
+        args=([account.model_dump() for _, account in accounts.values()],)
+      )
+      summary["task_id"] = task.id
+
+    return {
+      "status": "successful",
+      "message": f"successfully queued {summary['queued']} of {summary['received']} patient accounts, follow the progress at /tasks/{summary['task_id']}" if accounts else "no new patient account to import!",
+      "data": summary,
+    }
+
+
+
+  # hash n insert the queued accounts in batches, runs inside the celery worker
+  @staticmethod
+  async def insert_accounts(accounts: List[dict], report_progress: Callable):
+    progress = { "total": len(accounts), "processed": 0, "inserted": 0, "skipped": 0, "errors": [] }
+
+    # celery worker processes are daemonic n can't start a multiprocessing pool, billiard can
+    with Pool() as pool:
+      async with TaskSessionLocal() as db:
+        for i in range(0, len(accounts), ACCOUNT_BATCH_SIZE):
+          batch = accounts[i:i + ACCOUNT_BATCH_SIZE]
+          hashed_passwords = pool.map(hash_encrypted_password, [account['password'] for account in batch])
+
+          users = []
+          patients = []
+          for account, hashed_password in zip(batch, hashed_passwords):
+            if hashed_password is None:
+              progress["errors"].append({ "email": account['email'], "errors": ['password decryption failed'] })
+              continue
+
+            id = uuid4()
+            users.append({ 
+              "id": id, 
+              "password": hashed_password, 
+              "created_by": 'admin', 
+              "type": 'patient', # core inserts skip the orm polymorphic identity
+              **{ key: account.get(key) for key in USER_COLUMNS } 
+            })
+            patients.append({ "id": id, **{ key: account.get(key) for key in PATIENT_COLUMNS } })
+
+          if users:
+            # emails registered since the upload was checked are skipped instead of failing the batch
+            result = await db.execute(
+              pg_insert(User.__table__).values(users)
+              .on_conflict_do_nothing(index_elements=['email'])
+              .returning(User.__table__.c.id)
+            )
+            created = set(result.scalars().all())
+            patients = [patient for patient in patients if patient['id'] in created]
+
+            if patients:
+              await db.execute(insert(Patient.__table__).values(patients))
+            await db.commit()
+
+            progress["inserted"] += len(patients)
+            progress["skipped"] += len(users) - len(patients)
+
+          progress["processed"] += len(batch)
+          report_progress(state='PROGRESS', meta=progress)
+
+    return progress
@@ -1,11 +1,16 @@
-from sqlalchemy.orm import Session, defer
-from sqlalchemy import func
+from sqlalchemy.orm import defer
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select, update
 from fastapi import HTTPException, Query
 
-from app.models import User, Patient
+from app.models import User, Patient, HealthRecord
 from app.core.utils import ResponseHandler
 from app.schemas.users import UserResponse, UserUpdate, UserPasswordChange, PatientCreateAdmin, PatientResponseAdmin, PatientUpdateAdmin
-from app.core.security import short_url_to_uuid, decrypt, verify_password, generate_hash
+from app.core.security import short_url_to_uuid, decrypt
+from app.core.pagination import paginate, next_cursor
+from app.core.updates import update_returning
+from app.core.hashing import hasher
+from app.core.principals import principals
 
 
 class PatientService:
@@ -42,7 +47,7 @@ class PatientService:
     id: str, 
     updated_data: UserUpdate, 
     session_user: Patient, 
-    db: Session
+    db: AsyncSession
   ):
     user_id = short_url_to_uuid(id) # get the original uuid from the url 
 
@@ -57,33 +62,27 @@ class PatientService:
         detail=f'updating profile information failed, no field was provided - {user_id}'
       )
 
-    # update the patient information
+    # update the patient information, the session user may come from the principal cache so the
+    # response is built from the returned rows instead of refreshing it
     payload = { "updated_at": func.now(), **updated_data.none_excluded() }
-    user_payload = { key: val for key, val in payload.items() if key in User.__table__.columns }
-    patient_payload = { key: val for key, val in payload.items() if key in Patient.__table__.columns }
-
-    if user_payload:
-      db.query(User).where(User.id == user_id).update(user_payload)
-    
-    if patient_payload:
-      db.query(Patient).where(Patient.id == user_id).update(patient_payload)
+    patient = await update_returning(Patient, user_id, payload, db)
     
-    db.commit()
-    db.refresh(session_user)
+    await db.commit()
+    await principals.invalidate([user_id])
 
     return {
       "status": "successful",
       "message": f"successfully updated profile information - {user_id}",
       "data": UserResponse(
         url=id,
-        name=session_user.name,
-        email=session_user.email,
-        profession=session_user.profession,
-        gender=session_user.gender,
-        date_of_birth=session_user.date_of_birth,
-        address=session_user.address,
-        contact_number=session_user.contact_number,
-        emergency_number=session_user.emergency_number,
+        name=patient['name'],
+        email=patient['email'],
+        profession=patient['profession'],
+        gender=patient['gender'],
+        date_of_birth=patient['date_of_birth'],
+        address=patient['address'],
+        contact_number=patient['contact_number'],
+        emergency_number=patient['emergency_number'],
       )
     }
   
@@ -92,8 +91,9 @@ class PatientService:
 
   # handle updating account password /default
   @staticmethod
-  async def change_user_password(updated_data: UserPasswordChange, session_user: Patient, db: Session):
-    targeted_user = db.query(User).where(User.id == session_user.id).first()
+  async def change_user_password(updated_data: UserPasswordChange, session_user: Patient, db: AsyncSession):
+    result = await db.execute(select(User).where(User.id == session_user.id))
+    targeted_user = result.scalars().first()
 
     # decrypt the passwords from the client 
     decrypted_old_pass = await decrypt(updated_data.old_password)
@@ -101,16 +101,16 @@ class PatientService:
 
     
     # verify user old password 
-    if not verify_password(decrypted_old_pass, targeted_user.password):
+    if not await hasher.verify(decrypted_old_pass, targeted_user.password):
       raise HTTPException(status_code=400, detail=f"old password is incorrect - {targeted_user.id}")
     
     # generate the new hashed password 
-    new_hashed_pass = generate_hash(decrypted_new_pass)
+    new_hashed_pass = await hasher.hash(decrypted_new_pass)
     
     # update the password
     payload = { 'password': new_hashed_pass, 'updated_at': func.now() }
-    db.query(User).where(User.id == session_user.id).update(payload)
-    db.commit()
+    await db.execute(update(User).where(User.id == session_user.id).values(payload))
+    await db.commit()
 
     return {
       "status": "successful",
@@ -123,25 +123,54 @@ class PatientService:
   # retrieve all patient informations 
   @staticmethod
   async def retrieve_all_patients_admin(
-    db: Session,
+    db: AsyncSession,
     offset: int = 0, 
     # this way it adds a layer of constraint, asking the parameter either be 100 or less than 100
     limit: int = Query(default=100, le=100),
+    cursor: str = None,
   ):
-    patients = db.query(Patient).offset(offset).limit(limit).options(defer(Patient.password)).all()
+    query = select(Patient).options(defer(Patient.password))
+    result = await db.execute(paginate(query, Patient, offset, limit, cursor))
+    patients = result.scalars().all()
     
     return {
       "status": "successful",
       "message": "successfully fetched all patients!",
       "data": patients,
+      "next_cursor": next_cursor(patients, limit, offset, cursor),
+    } 
+  
+  
+
+  # find patients whose health record lists the given diabetes history entry /admin
+  @staticmethod
+  async def find_patients_by_diabetes_record(
+    record: str,
+    db: AsyncSession,
+    offset: int = 0, 
+    limit: int = Query(default=100, le=100),
+    cursor: str = None,
+  ):
+    # the containment (@>) subquery is served by the gin index on previous_diabetes_records
+    matching = select(HealthRecord.patient_id).where(HealthRecord.previous_diabetes_records.contains([record]))
+    query = select(Patient).where(Patient.id.in_(matching)).options(defer(Patient.password))
+    result = await db.execute(paginate(query, Patient, offset, limit, cursor))
+    patients = result.scalars().all()
+    
+    return {
+      "status": "successful",
+      "message": f"successfully found {len(patients)} patients!",
+      "data": patients,
+      "next_cursor": next_cursor(patients, limit, offset, cursor),
     } 
   
   
 
   # create a new patient account /admin
   @staticmethod
-  async def create_patient_account_admin(patient_data: PatientCreateAdmin, db: Session):
-    exits = db.query(User).where(User.email == patient_data.email).first()
+  async def create_patient_account_admin(patient_data: PatientCreateAdmin, db: AsyncSession):
+    result = await db.execute(select(User).where(User.email == patient_data.email))
+    exits = result.scalars().first()
     
     # check if the user exists
     if exits:
@@ -154,7 +183,7 @@ class PatientService:
     decrypted_password = await decrypt(patient_data.password) # decrypt the password from the client
     
     # generate hashed password
-    hashed_password = generate_hash(decrypted_password)
+    hashed_password = await hasher.hash(decrypted_password)
     patient_data.password = hashed_password
 
     payload = { 'created_by': 'admin', **patient_data.model_dump() }
@@ -163,8 +192,8 @@ class PatientService:
     new_patient = Patient(**payload)
     
     db.add(new_patient)
-    db.commit()
-    db.refresh(new_patient)
+    await db.commit()
+    await db.refresh(new_patient)
 
     return {
       "status": "successful",
@@ -176,8 +205,9 @@ class PatientService:
 
   # get patient information using id /admin
   @staticmethod
-  async def get_patient_information_admin(id: str, db: Session):
-    patient = db.query(Patient).where(Patient.id == id).first()
+  async def get_patient_information_admin(id: str, db: AsyncSession):
+    result = await db.execute(select(Patient).where(Patient.id == id))
+    patient = result.scalars().first()
 
     if not patient:
       raise ResponseHandler.not_found_error(f'patient not found - {id}')
@@ -205,58 +235,47 @@ class PatientService:
 
   # update patient information using id /admin
   @staticmethod 
-  async def update_patient_information_admin(id: str, details: PatientUpdateAdmin, db: Session):
-    patient = db.query(Patient).where(Patient.id == id).first()
-
-    # if no patient found 
-    if not patient:
-      raise ResponseHandler.not_found_error(f'patient not found - {id}')
-
+  async def update_patient_information_admin(id: str, details: PatientUpdateAdmin, db: AsyncSession):
     if(details.is_empty()):
       raise HTTPException(
         status_code=400,
-        detail=f"updating patient failed, no field was provided - {patient.id}"
+        detail=f"updating patient failed, no field was provided - {id}"
       )
 
     # check if the password is given or not
     if details.password:
       decrypted_new_pass = await decrypt(details.password)
-      new_hashed_pass = generate_hash(decrypted_new_pass)
+      new_hashed_pass = await hasher.hash(decrypted_new_pass)
       details.password = new_hashed_pass
 
 
-    # update the patient information
+    # update the users n patients rows, each statement returns its columns
     payload = { "updated_at": func.now(), **details.none_excluded() }
-    user_payload = { key: val for key, val in payload.items() if key in User.__table__.columns }
-    patient_payload = { key: val for key, val in payload.items() if key in Patient.__table__.columns }
-
+    patient = await update_returning(Patient, id, payload, db)
 
-    if user_payload:
-      db.query(User).where(User.id == id).update(user_payload)
-    
-    if patient_payload:
-      db.query(Patient).where(Patient.id == id).update(patient_payload)
-    
+    # if no patient found 
+    if not patient:
+      raise ResponseHandler.not_found_error(f'patient not found - {id}')
 
-    db.commit()
-    db.refresh(patient)
+    await db.commit()
+    await principals.invalidate([patient['id']])
 
 
     return {
       "status": "successful",
-      "message": f"successfully updated patient information - {patient.id}",
+      "message": f"successfully updated patient information - {patient['id']}",
       "data": PatientResponseAdmin(
-        id=str(patient.id),
-        email=patient.email,
-        name=patient.name,
-        gender=patient.gender,
-        address=patient.address,
-        date_of_birth=patient.date_of_birth,
-        profession=patient.profession,
-        contact_number=patient.contact_number,
-        emergency_number=patient.emergency_number,
-        created_at=patient.created_at,
-        updated_at=patient.updated_at,
+        id=str(patient['id']),
+        email=patient['email'],
+        name=patient['name'],
+        gender=patient['gender'],
+        address=patient['address'],
+        date_of_birth=patient['date_of_birth'],
+        profession=patient['profession'],
+        contact_number=patient['contact_number'],
+        emergency_number=patient['emergency_number'],
+        created_at=patient['created_at'],
+        updated_at=patient['updated_at'],
       )
     }
 
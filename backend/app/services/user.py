@@ -1,35 +1,48 @@
 from fastapi import Query, HTTPException
-from sqlalchemy import func
-from sqlalchemy.orm import Session, defer
+from sqlalchemy import func, select, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer
 from typing import List
 
 from app.schemas.users import UserAdminCreate, UserAdminResponse, UserAdminUpdate
-from app.core.security import decrypt, generate_hash
-from app.models import User
+from app.core.security import decrypt
+from app.models import User, Doctor
 from app.core.utils import ResponseHandler
+from app.core.pagination import paginate, next_cursor
+from app.core.batch import delete_by_ids, DELETE_CHUNK_SIZE
+from app.core.updates import update_returning
+from app.core.revocation import revocations
+from app.core.hashing import hasher
+from app.core.principals import principals
+from app.services.doctor import doctor_cache
 
 
 class UserService:
   @staticmethod
   async def retrieve_all_users(
-    db: Session,
+    db: AsyncSession,
     offset: int = 0, 
     # this way it adds a layer of constraint, asking the parameter either be 100 or less than 100
     limit: int = Query(default=100, le=100),
+    cursor: str = None,
   ):
-    users = db.query(User).offset(offset).limit(limit).options(defer(User.password)).all()
+    query = select(User).options(defer(User.password))
+    result = await db.execute(paginate(query, User, offset, limit, cursor))
+    users = result.scalars().all()
     
     return {
       "status": "successful",
       "message": "successfully fetched all users!",
       "data": users,
+      "next_cursor": next_cursor(users, limit, offset, cursor),
     } 
 
 
   # create a new user account /admin 
   @staticmethod
-  async def create_new_user(user_data: UserAdminCreate, db: Session):
-    exits = db.query(User).where(User.email == user_data.email).first()
+  async def create_new_user(user_data: UserAdminCreate, db: AsyncSession):
+    result = await db.execute(select(User).where(User.email == user_data.email))
+    exits = result.scalars().first()
     
     # check if the user exists
     if exits:
@@ -41,7 +54,7 @@ class UserService:
     decrypted_password = await decrypt(user_data.password) # decrypt the password from the client
     
     # generate hashed password
-    hashed_password = generate_hash(decrypted_password)
+    hashed_password = await hasher.hash(decrypted_password)
     user_data.password = hashed_password
 
     payload = { 'created_by': 'admin', **user_data.model_dump() }
@@ -50,8 +63,8 @@ class UserService:
     new_user = User(**payload)
     
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
 
     return {
       "status": "successful",
@@ -72,8 +85,9 @@ class UserService:
 
   # get user account informations by id /admin
   @staticmethod
-  async def get_user_by_id(id: str, db: Session):
-    user = db.query(User).where(User.id == id).first()
+  async def get_user_by_id(id: str, db: AsyncSession):
+    result = await db.execute(select(User).where(User.id == id))
+    user = result.scalars().first()
     
     # if no user was found 
     if not user:
@@ -95,14 +109,7 @@ class UserService:
 
   # update user account informations by id /admin
   @staticmethod
-  async def update_user_by_id(id: str, updated_data: UserAdminUpdate, db: Session):
-    # get the user 
-    user = db.query(User).where(User.id == id).first()
-    
-    # if no user found 
-    if not user:
-      raise ResponseHandler.not_found_error(f'user not found - {id}')
-    
+  async def update_user_by_id(id: str, updated_data: UserAdminUpdate, db: AsyncSession):
     if(updated_data.is_empty()):
       raise HTTPException(
         status_code=400,
@@ -112,42 +119,65 @@ class UserService:
     # check if the password is given or not
     if updated_data.password:
       decrypted_new_pass = await decrypt(updated_data.password)
-      new_hashed_pass = generate_hash(decrypted_new_pass)
+      new_hashed_pass = await hasher.hash(decrypted_new_pass)
       updated_data.password = new_hashed_pass
 
-    # update the user 
+    # update the user n get the updated row back in the same round trip
     updated_payload = { "updated_at": func.now(), **updated_data.none_excluded() }
+    user = await update_returning(User, id, updated_payload, db)
     
-    db.query(User).where(User.id == id).update(updated_payload)
-    db.commit()
-    db.refresh(user)
+    # if no user found 
+    if not user:
+      raise ResponseHandler.not_found_error(f'user not found - {id}')
+
+    # tokens carry the role, the ones issued before a role change must not authorize anymore
+    if updated_data.role:
+      await revocations.revoke_subjects([user['id']])
+
+    await db.commit()
+    await principals.invalidate([user['id']])
+
+    # the user columns of a doctor (name, email, ...) are part of the doctor listings
+    if user['type'] == 'doctor':
+      await doctor_cache.invalidate(tags=[f"doctor:{user['id']}"])
 
     return {
       "status": "successful",
-      "message": f"successfully updated user-{user.id} profile!",
+      "message": f"successfully updated user-{user['id']} profile!",
       "data": UserAdminResponse(
-        id=str(user.id),
-        email=user.email,
-        name=user.name,
-        role=user.role,
-        gender=user.gender,
-        address=user.address,
-        created_at=user.created_at,
-        updated_at=user.updated_at
+        id=str(user['id']),
+        email=user['email'],
+        name=user['name'],
+        role=user['role'],
+        gender=user['gender'],
+        address=user['address'],
+        created_at=user['created_at'],
+        updated_at=user['updated_at']
       ) 
     }
 
 
   # delete user account by id /admin
   @staticmethod
-  async def delete_user_by_id(id: str, db: Session):
-    targeted_user = db.query(User).where(User.id == id).first()
+  async def delete_user_by_id(id: str, db: AsyncSession):
+    result = await db.execute(select(User).where(User.id == id))
+    targeted_user = result.scalars().first()
   
     if not targeted_user:
       raise ResponseHandler.not_found_error(f'user not found - {id}')
     
-    db.delete(targeted_user)
-    db.commit()
+    # a deleted doctor also leaves the listing of its hospital
+    if targeted_user.type == 'doctor':
+      result = await db.execute(select(Doctor.hospital_id).where(Doctor.id == targeted_user.id))
+      hospital_id = result.scalar()
+
+    await revocations.revoke_subjects([targeted_user.id]) # tokens of the account die w it
+    await db.delete(targeted_user)
+    await db.commit()
+    await principals.invalidate([targeted_user.id])
+
+    if targeted_user.type == 'doctor':
+      await doctor_cache.invalidate(tags=['list', f'doctor:{targeted_user.id}', f'hospital:{hospital_id}'])
 
     return {
       "status": "successful",
@@ -158,22 +188,31 @@ class UserService:
 
   # delete a batch of user accounts /admin
   @staticmethod
-  async def delete_user_batch(ids: List[str], db: Session):
-    # get the target users w the ids 
-    targeted_users = db.query(User).filter(User.id.in_(ids)).all()
-    
-    # get the missing ids if there is any
-    existing_ids = [str(user.id) for user in targeted_users]
-    missing_ids = list(set(ids) - set(existing_ids))
+  async def delete_user_batch(ids: List[str], db: AsyncSession):
+    # the doctors among the targeted users n their hospitals, whose listings drop them
+    doctors = []
+    for i in range(0, len(ids), DELETE_CHUNK_SIZE):
+      result = await db.execute(select(Doctor.id, Doctor.hospital_id).where(Doctor.id.in_(ids[i:i + DELETE_CHUNK_SIZE])))
+      doctors.extend(result.all())
+
+    # delete the targeted users in a single round trip per chunk, the returned ids tell which existed
+    existing_ids, missing_ids = await delete_by_ids(User, ids, db)
     missing_message = None
 
     # if targeted users not found
     if len(existing_ids) == 0:
       raise ResponseHandler.not_found_error("user " +  ", ".join(missing_ids) + " has not been found!")
 
-    # delete the targeted users 
-    db.query(User).filter(User.id.in_(ids)).delete(synchronize_session=False)
-    db.commit()
+    await revocations.revoke_subjects(existing_ids)
+    await db.commit()
+    await principals.invalidate(existing_ids)
+
+    if doctors:
+      await doctor_cache.invalidate(tags=[
+        'list',
+        *(f'doctor:{doctor_id}' for doctor_id, _ in doctors),
+        *{ f'hospital:{hospital_id}' for _, hospital_id in doctors },
+      ])
 
     # custom message when some of the ids are missing 
     if len(missing_ids) > 0:
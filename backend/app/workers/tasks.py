@@ -1,7 +1,9 @@
 import time 
+import asyncio
 from app.workers.celery import celery
 from app.core.config import settings
 from app.services.mail import send_email
+from app.services.ingest import PatientAccountImport
 
 
 @celery.task(name="app.workers.tasks.greeting")
@@ -12,4 +14,9 @@ def greet_owner(name: str):
 def send_email_task(recipient: str, subject: str, body: str):
     send_email(recipient, subject, body)
     return { "message": "successfully email sent!", "sender": settings.owner_email, "recipient": recipient }
-    
+
+
+@celery.task(bind=True, name="app.workers.tasks.import_patients")
+def import_patients_task(self, accounts: list):
+    # progress is published as the PROGRESS state, readable through /tasks/{task_id}
+    return asyncio.run(PatientAccountImport.insert_accounts(accounts, self.update_state))
@@ -0,0 +1,85 @@
+"""
+simple http load generator for the backend api
+
+run it against a running backend, once on the old build and once on the new one:
+  python -m benchmarks.load_test --base-url http://localhost:3001/api/v1 --token <access token> --patient <patient url>
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+
+# hammer a single endpoint w a fixed number of concurrent clients for a given duration
+async def run_endpoint(client: httpx.AsyncClient, path: str, params: dict, concurrency: int, duration: float):
+  latencies = []
+  errors = 0
+  deadline = time.perf_counter() + duration
+
+  async def worker():
+    nonlocal errors
+    while time.perf_counter() < deadline:
+      start_time = time.perf_counter()
+      try:
+        response = await client.get(path, params=params)
+        if response.status_code >= 400:
+          errors += 1
+      except httpx.HTTPError:
+        errors += 1
+      latencies.append((time.perf_counter() - start_time) * 1000)
+
+  started = time.perf_counter()
+  await asyncio.gather(*(worker() for _ in range(concurrency)))
+  elapsed = time.perf_counter() - started
+
+  return summarize(path, latencies, errors, elapsed)
+
+
+
+# build a short report out of the collected latencies
+def summarize(name: str, latencies: list, errors: int, elapsed: float):
+  if not latencies:
+    return { "endpoint": name, "requests": 0 }
+
+  ordered = sorted(latencies)
+  return {
+    "endpoint": name,
+    "requests": len(ordered),
+    "errors": errors,
+    "throughput": round(len(ordered) / elapsed, 2),
+    "p50_ms": round(statistics.median(ordered), 2),
+    "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 2),
+  }
+
+
+
+def print_report(report: dict):
+  print(" | ".join(f"{key}: {val}" for key, val in report.items()))
+
+
+
+async def main(args):
+  headers = { "Authorization": f"Bearer {args.token}" } if args.token else {}
+  limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+  async with httpx.AsyncClient(base_url=args.base_url, headers=headers, limits=limits, timeout=30) as client:
+    print_report(await run_endpoint(client, '/hospitals/all', { "offset": 0, "limit": 25 }, args.concurrency, args.duration))
+
+    # the health record endpoint needs an authenticated patient
+    if args.token and args.patient:
+      print_report(await run_endpoint(client, '/users/patients/health/records', { "id": args.patient }, args.concurrency, args.duration))
+
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--base-url', default='http://localhost:3001/api/v1')
+  parser.add_argument('--token', default=None)
+  parser.add_argument('--patient', default=None, help='short url of the patient owning the token')
+  parser.add_argument('--concurrency', type=int, default=100)
+  parser.add_argument('--duration', type=float, default=15)
+
+  asyncio.run(main(parser.parse_args()))
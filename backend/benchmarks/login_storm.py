@@ -0,0 +1,77 @@
+"""
+login storm, checks that password hashing doesn't stall the rest of the api
+
+measures the latency of an unrelated endpoint on its own, then again while a number of
+concurrent clients keep logging in. w hashing off the event loop the two should stay close.
+  python -m benchmarks.login_storm --email patient@example.com --password secret --concurrency 50
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from app.core.security import encrypt
+from benchmarks.load_test import run_endpoint, summarize, print_report
+
+
+
+# keep logging in until the deadline, counting the requests the server shed w a 503
+async def run_logins(client: httpx.AsyncClient, credentials: dict, concurrency: int, duration: float):
+  latencies = []
+  errors = 0
+  shed = 0
+  deadline = time.perf_counter() + duration
+
+  async def worker():
+    nonlocal errors, shed
+    while time.perf_counter() < deadline:
+      start_time = time.perf_counter()
+      try:
+        response = await client.post('/auth/login', json=credentials)
+        if response.status_code == 503:
+          shed += 1
+        elif response.status_code >= 400:
+          errors += 1
+      except httpx.HTTPError:
+        errors += 1
+      latencies.append((time.perf_counter() - start_time) * 1000)
+
+  started = time.perf_counter()
+  await asyncio.gather(*(worker() for _ in range(concurrency)))
+  elapsed = time.perf_counter() - started
+
+  return { **summarize('/auth/login', latencies, errors, elapsed), "shed": shed }
+
+
+
+async def main(args):
+  credentials = { "email": args.email, "password": encrypt(args.password) }
+  params = { "offset": 0, "limit": 25 }
+  limits = httpx.Limits(max_connections=args.concurrency + args.probes, max_keepalive_connections=args.concurrency + args.probes)
+
+  async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=30) as client:
+    print("baseline")
+    print_report(await run_endpoint(client, args.probe_path, params, args.probes, args.duration))
+
+    print("during the login storm")
+    storm, probe = await asyncio.gather(
+      run_logins(client, credentials, args.concurrency, args.duration),
+      run_endpoint(client, args.probe_path, params, args.probes, args.duration),
+    )
+    print_report(storm)
+    print_report(probe)
+
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--base-url', default='http://localhost:3001/api/v1')
+  parser.add_argument('--email', required=True)
+  parser.add_argument('--password', required=True, help='plain password, encrypted like the frontend does')
+  parser.add_argument('--concurrency', type=int, default=50, help='concurrent login clients')
+  parser.add_argument('--probes', type=int, default=5, help='concurrent clients of the probed endpoint')
+  parser.add_argument('--probe-path', default='/hospitals/all')
+  parser.add_argument('--duration', type=float, default=15)
+
+  asyncio.run(main(parser.parse_args()))
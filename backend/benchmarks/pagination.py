@@ -0,0 +1,68 @@
+"""
+compare the latency of a deep page using offset and cursor pagination
+
+  python -m benchmarks.pagination --token <admin access token> --path /admin/users/all --page 1000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+
+# time the same request a few times and keep the median
+async def measure(client: httpx.AsyncClient, path: str, params: dict, repeat: int):
+  latencies = []
+
+  for _ in range(repeat):
+    start_time = time.perf_counter()
+    response = await client.get(path, params=params)
+    response.raise_for_status()
+    latencies.append((time.perf_counter() - start_time) * 1000)
+
+  return round(statistics.median(latencies), 2)
+
+
+
+# follow next_cursor until the cursor of the requested page is known
+async def seek_cursor(client: httpx.AsyncClient, path: str, page: int, limit: int):
+  cursor = None
+
+  for _ in range(page - 1):
+    params = { "limit": limit, **({ "cursor": cursor } if cursor else {}) }
+    response = await client.get(path, params=params)
+    response.raise_for_status()
+    cursor = response.json().get('next_cursor')
+
+    if not cursor:
+      raise SystemExit(f"ran out of rows before page {page}, seed more data first")
+
+  return cursor
+
+
+
+async def main(args):
+  headers = { "Authorization": f"Bearer {args.token}" } if args.token else {}
+
+  async with httpx.AsyncClient(base_url=args.base_url, headers=headers, timeout=60) as client:
+    offset_ms = await measure(client, args.path, { "offset": (args.page - 1) * args.limit, "limit": args.limit }, args.repeat)
+
+    cursor = await seek_cursor(client, args.path, args.page, args.limit)
+    cursor_ms = await measure(client, args.path, { "cursor": cursor, "limit": args.limit }, args.repeat)
+
+  print(f"{args.path} page {args.page} (limit {args.limit}) | offset: {offset_ms}ms | cursor: {cursor_ms}ms")
+
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--base-url', default='http://localhost:3001/api/v1')
+  parser.add_argument('--token', default=None)
+  parser.add_argument('--path', default='/admin/users/all')
+  parser.add_argument('--page', type=int, default=1000)
+  parser.add_argument('--limit', type=int, default=100)
+  parser.add_argument('--repeat', type=int, default=20)
+
+  asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,175 @@
+"""
+query plan regression check for the hot service queries
+
+runs EXPLAIN for every query below against the configured database and exits w a non zero
+status when one of them falls back to a sequential scan. pass --seed to insert synthetic rows
+first, the whole run happens inside a transaction that is rolled back at the end. the same check
+runs as part of the test suite (tests/test_query_plans.py) when TEST_DATABASE_URL is set.
+
+  python -m benchmarks.query_plans --seed 20000
+"""
+import argparse
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+from sqlalchemy import select, text
+from sqlalchemy.sql.expression import Executable, ClauseElement
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import with_polymorphic
+
+from app.db import engine
+from app.core.pagination import paginate, encode_cursor
+from app.models import User, Patient, Doctor, Hospital, HealthRecord, BloodGlucoseReading
+
+
+
+SEED_STATEMENTS = [
+  """
+  INSERT INTO hospitals (id, name, address, city, img_src, description, emails, contact_numbers, geometry, created_at)
+  SELECT gen_random_uuid(), 'hospital ' || g, 'address', 'city', 'img', 'description', '[]', '[]', '{}', now() - g * interval '1 minute'
+  FROM generate_series(1, greatest(CAST(:rows AS integer) / 100, 10)) g
+  """,
+  """
+  INSERT INTO users (id, email, role, type, created_by, created_at)
+  SELECT gen_random_uuid(), 'seed-' || g || '@example.com', CASE WHEN g % 5 = 0 THEN 'doctor' ELSE 'user' END, CASE WHEN g % 5 = 0 THEN 'doctor' ELSE 'patient' END, 'seed', now() - g * interval '1 second'
+  FROM generate_series(1, CAST(:rows AS integer)) g
+  """,
+  """
+  INSERT INTO patients (id)
+  SELECT id FROM users WHERE created_by = 'seed' AND role = 'user'
+  """,
+  """
+  INSERT INTO doctors (id, description, hospital_id, available_times, experience, emails, contact_numbers)
+  SELECT doctor.id, 'description', hospital.id, '9am - 5pm', 1, '[]', '[]'
+  FROM (SELECT id, row_number() OVER () AS rn FROM users WHERE created_by = 'seed' AND role = 'doctor') doctor
+  JOIN (SELECT id, row_number() OVER () - 1 AS rn, count(*) OVER () AS total FROM hospitals) hospital ON hospital.rn = doctor.rn % hospital.total
+  """,
+  """
+  INSERT INTO health_records (id, patient_id, weight, height, created_at)
+  SELECT gen_random_uuid(), id, 70, 5.8, now() - random() * interval '365 days'
+  FROM patients
+  """,
+  """
+  INSERT INTO blood_glucose_readings (id, patient_id, measured_at, value)
+  SELECT gen_random_uuid(), patients.id, now() - g * interval '6 hours', 80 + (random() * 60)::integer
+  FROM patients CROSS JOIN generate_series(1, 10) g
+  """,
+]
+
+
+
+# the queries issued by the services on their hot paths
+async def hot_queries(connection):
+  async def sample(query):
+    return (await connection.execute(query)).scalar() or uuid4()
+
+  hospital_id = await sample(select(Hospital.id).limit(1))
+  patient_id = await sample(select(Patient.id).limit(1))
+  email = (await connection.execute(select(User.email).limit(1))).scalar() or 'missing@example.com'
+  cursor = encode_cursor(datetime.now(timezone.utc) - timedelta(days=1), uuid4())
+  now = datetime.now(timezone.utc)
+  principal = with_polymorphic(User, [Patient, Doctor])
+
+  return {
+    "verify_token / principal by id": select(principal).where(principal.id == patient_id),
+    "login / user by email": select(User).where(User.email == email),
+    "users by role": select(User).where(User.role == 'doctor'),
+    "get_health_record_details": select(HealthRecord).where(HealthRecord.patient_id == patient_id),
+    "retrieve_doctors_by_hospital_*": paginate(select(Doctor).where(Doctor.hospital_id == hospital_id), Doctor, None, 25, None),
+    "retrieve_doctors_by_hospital_* (cursor)": paginate(select(Doctor).where(Doctor.hospital_id == hospital_id), Doctor, None, 25, cursor),
+    "retrieve_all_hospitals (cursor)": paginate(select(Hospital), Hospital, None, 100, cursor),
+    "retrieve_all_users (cursor)": paginate(select(User), User, None, 100, cursor),
+    "retrieve_all_patients_admin (cursor)": paginate(select(Patient), Patient, None, 100, cursor),
+    "retrieve_all_doctors_* (cursor)": paginate(select(Doctor), Doctor, None, 100, cursor),
+    "retrieve_all_health_records_admin (cursor)": paginate(select(HealthRecord), HealthRecord, None, 100, cursor),
+    "find_hospitals_by_contact": select(Hospital).where(Hospital.emails.contains([email])),
+    "find_doctors_by_contact": select(Doctor).where(Doctor.contact_numbers.contains(['+0000000000'])),
+    "find_patients_by_diabetes_record": select(HealthRecord.patient_id).where(HealthRecord.previous_diabetes_records.contains(['type 2'])),
+    "glucose readings of a time range": select(BloodGlucoseReading).where(
+      BloodGlucoseReading.patient_id == patient_id,
+      BloodGlucoseReading.measured_at >= now - timedelta(days=90),
+      BloodGlucoseReading.measured_at < now,
+    ),
+  }
+
+
+
+# EXPLAIN (FORMAT JSON) of a query, compiled n bound by the dialect of the connection like the query
+# itself. literal binds can't render the jsonb lists of the contact lookups
+class Explain(Executable, ClauseElement):
+  inherit_cache = False
+
+  def __init__(self, query):
+    self.query = query
+
+
+@compiles(Explain)
+def compile_explain(element, compiler, **kw):
+  return "EXPLAIN (FORMAT JSON) " + compiler.process(element.query, **kw)
+
+
+
+# collect every sequential scan node of an explain (format json) plan
+def sequential_scans(plan: dict):
+  scans = []
+
+  if plan.get("Node Type") == "Seq Scan":
+    scans.append(plan.get("Relation Name"))
+
+  for child in plan.get("Plans", []):
+    scans.extend(sequential_scans(child))
+
+  return scans
+
+
+
+# explain every hot query on the connection, name -> relations it scans sequentially (empty when
+# indexes cover it). w a seed, synthetic rows are inserted first. the caller owns the transaction
+# n is expected to roll it back
+async def explain_hot_queries(connection, seed: int = 0) -> dict:
+  if seed:
+    for statement in SEED_STATEMENTS:
+      await connection.execute(text(statement), { "rows": seed })
+    await connection.execute(text("ANALYZE"))
+
+  # a seq scan that survives this setting means no usable index exists
+  await connection.execute(text("SET LOCAL enable_seqscan = off"))
+
+  results = {}
+  for name, query in (await hot_queries(connection)).items():
+    plan = (await connection.execute(Explain(query))).scalar()
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+
+    results[name] = sequential_scans(plan[0]["Plan"])
+
+  return results
+
+
+
+async def main(args):
+  async with engine.connect() as connection:
+    transaction = await connection.begin()
+
+    try:
+      results = await explain_hot_queries(connection, args.seed)
+    finally:
+      await transaction.rollback()
+
+  await engine.dispose()
+
+  for name, scans in results.items():
+    print(f"{'FAIL' if scans else 'ok  '} {name}" + (f" -> seq scan on {', '.join(scans)}" if scans else ""))
+
+  failures = [name for name, scans in results.items() if scans]
+  if failures:
+    raise SystemExit(f"{len(failures)} hot queries fall back to a sequential scan")
+
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--seed', type=int, default=0, help='number of synthetic users to insert before explaining')
+
+  asyncio.run(main(parser.parse_args()))
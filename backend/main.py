@@ -1,4 +1,5 @@
 import uvicorn
 
 if __name__ == "__main__":
-  uvicorn.run("app.main:app", host="0.0.0.0", port=3001, reload=True)
+  # outlives the keepalive_timeout of the nginx upstream, so nginx never reuses a connection being closed
+  uvicorn.run("app.main:app", host="0.0.0.0", port=3001, reload=True, timeout_keep_alive=75)
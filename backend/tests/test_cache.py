@@ -0,0 +1,151 @@
+import asyncio
+from uuid import uuid4
+
+import pytest
+
+from app.core import cache
+from app.core.cache import LRUCache, NegativeCache
+
+
+class Clock:
+  def __init__(self):
+    self.now = 1000.0
+
+  def __call__(self):
+    return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+  clock = Clock()
+  monkeypatch.setattr(cache.time, 'monotonic', clock)
+  return clock
+
+
+
+def test_lru_evicts_the_least_recently_used(clock):
+  lru = LRUCache(maxsize=2, ttl=60)
+  lru.set('a', 1)
+  lru.set('b', 2)
+  lru.get('a') # a is now the most recently used
+  lru.set('c', 3)
+
+  assert lru.get('b') is None
+  assert lru.get('a') == 1 and lru.get('c') == 3
+  assert len(lru) == 2 and lru.evictions == 1
+
+
+def test_lru_entries_expire(clock):
+  lru = LRUCache(maxsize=10, ttl=5)
+  lru.set('a', 1)
+
+  clock.now += 4
+  assert lru.get('a') == 1
+
+  clock.now += 2
+  assert lru.get('a') is None
+  assert len(lru) == 0
+
+
+def test_lru_delete_n_clear(clock):
+  lru = LRUCache(maxsize=10, ttl=5)
+  lru.set('a', 1)
+  lru.set('b', 2)
+
+  lru.delete('a')
+  lru.delete('missing')
+  assert lru.get('a') is None and lru.get('b') == 2
+
+  lru.clear()
+  assert len(lru) == 0
+
+
+
+def test_negative_cache_remembers_missing_ids(clock):
+  missing = NegativeCache(f'test-{uuid4().hex}', ttl=30, size=2)
+  id = uuid4()
+
+  assert not missing.contains(id)
+  missing.add(id)
+
+  assert missing.contains(id)
+  assert missing.contains(str(id)) # uuids n their strings are the same id
+  assert missing.negative_hits == 2 and missing.recorded == 1
+
+  clock.now += 31
+  assert not missing.contains(id)
+
+
+def test_negative_cache_is_bounded(clock):
+  missing = NegativeCache(f'test-{uuid4().hex}', ttl=30, size=2)
+  ids = [uuid4() for _ in range(3)]
+
+  for id in ids:
+    missing.add(id)
+
+  assert not missing.contains(ids[0])
+  assert missing.snapshot()["size"] == 2
+
+
+def test_created_ids_are_forgotten(clock):
+  missing = NegativeCache(f'test-{uuid4().hex}', ttl=30, size=10)
+  created, other = uuid4(), uuid4()
+  missing.add(created)
+  missing.add(other)
+
+  # w/o a reachable redis the other workers aren't told, this worker still forgets the id
+  asyncio.run(missing.discard([created]))
+
+  assert not missing.contains(created)
+  assert missing.contains(other)
+
+
+
+# a load shared by concurrent callers doesn't depend on the request (n session) that started it, it
+# runs on a session of the primary even when the requests read from a replica
+def test_shared_load_survives_the_first_caller(monkeypatch):
+  fakeredis = pytest.importorskip('fakeredis')
+  pytest.importorskip('aiosqlite')
+
+  from sqlalchemy import text
+  from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+  from app.core import cache
+  from app.core.redis import redis_client
+  from app.core.cache import ResponseCache, cached
+
+  primary, replica = create_async_engine('sqlite+aiosqlite://'), create_async_engine('sqlite+aiosqlite://')
+  monkeypatch.setattr(cache, 'SessionLocal', async_sessionmaker(bind=primary, class_=AsyncSession))
+  monkeypatch.setattr(redis_client, 'client', fakeredis.FakeAsyncRedis(decode_responses=True))
+  response_cache = ResponseCache(f'test-{uuid4().hex}', ttl=60)
+  sessions = []
+
+  @cached(response_cache, 'key')
+  async def load(db: AsyncSession):
+    sessions.append(db)
+    await asyncio.sleep(0.2)
+    return { "value": (await db.execute(text('SELECT 1'))).scalar() }
+
+  async def request(requests: list):
+    async with AsyncSession(replica) as db:
+      requests.append(db)
+      return await load(db)
+
+  async def run():
+    first, second = [], []
+
+    cancelled = asyncio.create_task(request(first))
+    await asyncio.sleep(0.05)
+    waiting = asyncio.create_task(request(second))
+    await asyncio.sleep(0.05)
+
+    # the client of the first request disconnects, its session is closed
+    cancelled.cancel()
+    assert await waiting == { "value": 1 }
+    assert len(sessions) == 1 and sessions[0] is not first[0]
+    assert sessions[0].bind is primary
+    assert response_cache.stats.coalesced == 1
+
+    await primary.dispose()
+    await replica.dispose()
+
+  asyncio.run(run())
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+from starlette.requests import Request
+
+from app.core.config import settings
+from app.core.conditional import make_etag, etag_matches, conditional_response
+
+
+def request(if_none_match: str | None = None) -> Request:
+  headers = [(b'if-none-match', if_none_match.encode())] if if_none_match is not None else []
+  return Request({ "type": "http", "method": "GET", "path": "/", "headers": headers })
+
+
+
+def test_etag_is_a_quoted_stable_hash():
+  etag = make_etag({ "a": 1, "b": [1, 2] })
+
+  assert etag.startswith('"') and etag.endswith('"')
+  assert etag == make_etag({ "a": 1, "b": [1, 2] })
+  assert etag != make_etag({ "a": 2, "b": [1, 2] })
+
+
+@pytest.mark.parametrize('header, matches', [
+  (None, False),
+  ('', False),
+  ('"other"', False),
+  ('{etag}', True),
+  ('W/{etag}', True),
+  ('"other", {etag}', True),
+  ('*', True),
+])
+def test_etag_matches(header, matches):
+  etag = make_etag({ "a": 1 })
+  assert etag_matches(request(header.format(etag=etag) if header is not None else None), etag) is matches
+
+
+
+def test_response_carries_the_etag():
+  response = conditional_response(request(), { "a": 1 })
+
+  assert response.status_code == 200
+  assert response.headers['etag'] == make_etag({ "a": 1 })
+  assert response.headers['cache-control'] == 'no-cache'
+  assert json.loads(response.body) == { "a": 1 }
+
+
+def test_known_version_gets_a_bodiless_304():
+  etag = make_etag({ "a": 1 })
+  response = conditional_response(request(etag), { "a": 1 }, etag)
+
+  assert response.status_code == 304
+  assert response.body == b''
+  assert response.headers['etag'] == etag
+
+
+def test_shared_responses_may_be_kept_by_nginx():
+  cache_control = conditional_response(request(), { "a": 1 }, shared=True).headers['cache-control']
+
+  assert 'public' in cache_control and 'max-age=0' in cache_control
+  assert f's-maxage={settings.edge_cache_ttl}' in cache_control
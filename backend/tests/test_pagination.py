@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+from datetime import datetime, timezone
+from uuid import uuid4
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+from app.core.pagination import encode_cursor, decode_cursor, paginate, next_cursor
+from app.models import Hospital, Doctor
+
+
+def compile(query) -> str:
+  return str(query.compile(dialect=postgresql.dialect()))
+
+
+
+def test_cursor_round_trip():
+  created_at, id = datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc), uuid4()
+  cursor = encode_cursor(created_at, id)
+
+  assert '=' not in cursor
+  assert decode_cursor(cursor) == (created_at, id)
+
+
+@pytest.mark.parametrize('cursor', ['', 'not-a-cursor', encode_cursor(datetime.now(), uuid4())[:-4]])
+def test_invalid_cursor_is_a_bad_request(cursor):
+  with pytest.raises(HTTPException) as error:
+    decode_cursor(cursor)
+
+  assert error.value.status_code == 400
+
+
+
+def test_offset_is_kept_for_older_clients():
+  sql = compile(paginate(select(Hospital), Hospital, 20, 10, None))
+
+  assert 'OFFSET' in sql and 'ORDER BY' not in sql
+
+
+def test_cursor_seeks_past_the_last_row():
+  cursor = encode_cursor(datetime.now(timezone.utc), uuid4())
+  sql = compile(paginate(select(Hospital), Hospital, None, 10, cursor))
+
+  assert '(hospitals.created_at, hospitals.id) >' in sql
+  assert 'ORDER BY hospitals.created_at, hospitals.id' in sql
+  assert 'OFFSET' not in sql
+
+
+def test_subclasses_sort_on_the_users_table():
+  sql = compile(paginate(select(Doctor), Doctor, None, 10, None))
+
+  assert 'ORDER BY users.created_at, users.id' in sql
+
+
+
+def test_next_cursor():
+  rows = [SimpleNamespace(created_at=datetime(2024, 1, day, tzinfo=timezone.utc), id=uuid4()) for day in range(1, 4)]
+
+  assert decode_cursor(next_cursor(rows, 3)) == (rows[-1].created_at, rows[-1].id)
+  assert next_cursor(rows, 4) is None # short page, the last one
+  assert next_cursor(rows, None) is None
+  assert next_cursor(rows, 3, offset=0) is None # offset pagination has no cursor
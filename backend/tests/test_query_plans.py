@@ -0,0 +1,26 @@
+import asyncio
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from benchmarks.query_plans import explain_hot_queries
+
+
+
+# every hot lookup of the services is covered by an index. runs against TEST_DATABASE_URL, the
+# synthetic rows are inserted n rolled back in a single transaction
+def test_hot_queries_use_indexes(database_url):
+  async def explain():
+    engine = create_async_engine(database_url)
+
+    try:
+      async with engine.connect() as connection:
+        transaction = await connection.begin()
+        try:
+          return await explain_hot_queries(connection, seed=2000)
+        finally:
+          await transaction.rollback()
+    finally:
+      await engine.dispose()
+
+  results = asyncio.run(explain())
+  assert { name: scans for name, scans in results.items() if scans } == {}
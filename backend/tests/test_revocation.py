@@ -0,0 +1,81 @@
+import time
+import asyncio
+from uuid import uuid4
+
+import pytest
+
+from app.core.revocation import BloomFilter
+
+
+
+def test_added_items_are_always_found():
+  bloom = BloomFilter(size=1 << 16)
+  items = [uuid4().hex for _ in range(1000)]
+
+  for item in items:
+    bloom.add(item)
+
+  assert all(item in bloom for item in items)
+
+
+def test_false_positive_rate_stays_low():
+  bloom = BloomFilter(size=1 << 16)
+
+  for _ in range(1000):
+    bloom.add(uuid4().hex)
+
+  # ~65k bits n 7 hashes for 1000 items is well below 1% in theory
+  false_positives = sum(uuid4().hex in bloom for _ in range(10000))
+  assert false_positives < 100
+
+
+def test_empty_filter_contains_nothing():
+  assert 'anything' not in BloomFilter(size=1024)
+
+
+
+# the sync against redis, w fakeredis when it is installed
+@pytest.fixture
+def revocations(monkeypatch):
+  fakeredis = pytest.importorskip('fakeredis')
+
+  from app.core import revocation
+  from app.core.redis import redis_client
+
+  monkeypatch.setattr(redis_client, 'client', fakeredis.FakeAsyncRedis(decode_responses=True))
+  return revocation.RevocationList()
+
+
+def test_sync_only_fetches_new_revocations(revocations):
+  other = type(revocations)() # another worker sharing the redis
+
+  async def run():
+    await other.revoke_token('first')
+    await revocations.sync()
+    assert 'jti:first' in revocations.bloom
+    assert revocations.since is not None
+
+    # a later sync adds what was revoked in between to the same filter instead of rebuilding it
+    bloom = revocations.bloom
+    await other.revoke_token('second')
+    await other.revoke_subjects(['user'])
+    await revocations.sync()
+
+    assert revocations.bloom is bloom
+    assert 'jti:second' in bloom and 'sub:user' in bloom
+
+  asyncio.run(run())
+
+
+def test_tokens_issued_after_a_subject_revocation_stay_valid(revocations):
+  async def run():
+    issued_before = time.time()
+    await revocations.revoke_subjects(['user'])
+    issued_after = time.time()
+
+    # both in the same second most of the time, told apart by the fraction of iat
+    assert await revocations.is_revoked({ "sub": "user", "iat": issued_before })
+    assert not await revocations.is_revoked({ "sub": "user", "iat": issued_after })
+    assert not await revocations.is_revoked({ "sub": "other", "iat": issued_before })
+
+  asyncio.run(run())
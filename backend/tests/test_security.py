@@ -0,0 +1,21 @@
+import bcrypt
+
+from app.core.config import settings
+from app.core.security import needs_rehash
+
+
+
+def test_hash_of_the_configured_cost_is_kept():
+  hashed = f"$2b${settings.bcrypt_rounds:02d}$" + 'a' * 53
+  assert not needs_rehash(hashed)
+
+
+def test_hash_of_another_cost_is_rehashed():
+  hashed = bcrypt.hashpw(b'password', bcrypt.gensalt(rounds=4)).decode()
+  assert needs_rehash(hashed)
+
+
+def test_unknown_formats_are_left_alone():
+  assert not needs_rehash('')
+  assert not needs_rehash('plain-text')
+  assert not needs_rehash('$2b$xx$abc')
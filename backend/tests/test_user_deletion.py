@@ -0,0 +1,52 @@
+import asyncio
+from uuid import uuid4
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.models import User, Patient, HealthRecord
+
+
+
+# select(User) loads a patient as a Patient, deleting it must not try to detach its health records
+# (patient_id is not nullable) but leave them to the on delete cascade of the database
+async def delete_patient_with_record(session: AsyncSession):
+  patient = Patient(email=f'{uuid4().hex}@example.com', role='user', created_by='test')
+  session.add(patient)
+  await session.flush()
+
+  session.add(HealthRecord(patient_id=patient.id, weight=70, height=5.8))
+  await session.commit()
+  session.expunge_all()
+
+  # the same lookup n delete as UserService.delete_user_by_id
+  targeted_user = (await session.execute(select(User).where(User.id == patient.id))).scalars().first()
+  assert isinstance(targeted_user, Patient)
+
+  await session.delete(targeted_user)
+  await session.commit()
+
+  assert (await session.execute(select(User.id).where(User.id == patient.id))).scalar() is None
+  assert (await session.execute(select(HealthRecord.id).where(HealthRecord.patient_id == patient.id))).scalar() is None
+
+
+
+def test_deleting_a_patient_deletes_its_health_records(database_url):
+  async def run():
+    engine = create_async_engine(database_url)
+
+    try:
+      async with engine.connect() as connection:
+        transaction = await connection.begin()
+        # commits of the session only release savepoints, everything is rolled back at the end
+        session = AsyncSession(bind=connection, join_transaction_mode='create_savepoint', expire_on_commit=False)
+
+        try:
+          await delete_patient_with_record(session)
+        finally:
+          await session.close()
+          await transaction.rollback()
+    finally:
+      await engine.dispose()
+
+  asyncio.run(run())